@@ -1,74 +1,281 @@
 import cv2
-import numpy as np
+import argparse
 import datetime
+import threading
+import time
 from typing import Dict, List
 
 from modules.config_loader.yaml_loader import load_config
 from modules.detection.yolov11 import Yolov11Detector
+from modules.detection.scheduler import DetectionScheduler
+from modules.embedding.base import IEmbedding
 from modules.tracker.sort import Sort
 from modules.track_manager.track_manager import TrackManager
 from modules.gallery.gallery import Gallery
 from modules.templates.templates import sTrackInfo, TimeSession, TrackInfo
 from modules.matching.matching import Matching
+from modules.pipeline.queues import StageQueue, END_OF_STREAM
+from modules.pipeline.sources import build_source
+from modules.pipeline.writer import AsyncVideoWriter
+
+# detections of a frame left to the scheduler, decided and run by the track stage
+SCHEDULED = object()
 
 
 class SCRReid:
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, embed: IEmbedding = None):
         self.tracker = Sort(config["Tracking"]["box_track"])
         self.detector = Yolov11Detector(config["DETECTION"]["yolov11"])
-        self.track_manager = TrackManager(config["TRACK_MANAGER"])
+        self.scheduler = DetectionScheduler(config["DETECTION"].get("scheduler", {}))
+        self.track_manager = TrackManager(config["TRACK_MANAGER"], embed)
         self.gallery = Gallery(config["GALLERY"])
         self.matching = Matching(config["TRACK_MANAGER"]["join_track"])
-        
-        # Video capture
-        self.cap = cv2.VideoCapture('../assets/video_2min.mp4')
-        self.fps = 30
-        
-        
+
+        # sequential: one loop, threaded: decode / detect / track / render stages with bounded queues
+        pipeline_cfg = config.get("PIPELINE", {})
+        self.mode = pipeline_cfg.get("mode", "sequential")
+        self.queue_size = pipeline_cfg.get("queue_size", 8)
+        self.drop_frames = pipeline_cfg.get("drop_frames", False)
+        # frames detected per inference call, and how long to wait for a batch to fill up
+        self.detect_batch_size = pipeline_cfg.get("detect_batch_size", 1)
+        self.detect_batch_timeout = pipeline_cfg.get("detect_batch_timeout_ms", 50) / 1000.
+
+        # enable: draw the tracks, display: cv2 window (No on headless servers),
+        # out_video: annotated video written by a background thread
+        viz_cfg = config.get("VIZ", {})
+        self.render = viz_cfg.get("enable", True)
+        self.display = viz_cfg.get("display", True)
+        self.out_video = viz_cfg.get("out_video") if self.render else None
+        self.writer_queue_size = viz_cfg.get("writer_queue_size", 32)
+        self.writer = None
+
+        # Video capture: frames are read into a ring of buffers, given back once rendered or dropped.
+        # Sized for the frames in flight (3 stage queues, a detection batch, one item held by every
+        # stage and the writer queue) so that the decoder rarely waits for a free buffer
+        num_buffers = 3 * self.queue_size + self.detect_batch_size + 4
+        if self.out_video:
+            num_buffers += self.writer_queue_size + 2
+        self.cap = build_source(config.get("SOURCE", {}), num_buffers)
+        self.fps = self.cap.fps
+        self.start_time = datetime.datetime.strptime('2015-08-02 16:00:00', "%Y-%m-%d %H:%M:%S")
+
     def run(self):
+        if self.mode == "threaded":
+            return self.run_threaded()
+
         frame_count = 0
-        start_time = datetime.datetime.strptime('2015-08-02 16:00:00', "%Y-%m-%d %H:%M:%S")
 
         print("Starting ReID pipeline...")
         print(f"Video FPS: {self.fps}")
         print("=" * 50)
+        self._open_writer()
+        st_time = time.time()
+
+        is_stopped = False
+        while not is_stopped:
+            # read up to detect_batch_size frames and detect them in one call
+            batch = []
+            while len(batch) < self.detect_batch_size and self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                frame_count += 1
+                cur_time = self.start_time + datetime.timedelta(seconds=frame_count/self.fps)
+                batch.append((frame, frame_count, cur_time))
+            if not batch:
+                break
+
+            l_batch_bboxes = self._detect_batch([frame for frame, _, _ in batch])
+            for (frame, frame_count, cur_time), l_bboxes in zip(batch, l_batch_bboxes):
+                print(f'[INFO] Processing frame {frame_count}')
+                draw_items = self._track(l_bboxes, frame, frame_count, cur_time)
+                if self._render(frame, draw_items):
+                    is_stopped = True
+                    break
+
+        self._close(frame_count, time.time() - st_time)
+
+    def run_threaded(self):
+        """
+        Same results as the sequential loop, but decoding, detection and tracking run in their
+        own threads so they overlap with each other and with rendering (kept on the main thread
+        for cv2.imshow).
+        """
+        stop_event = threading.Event()
+        # dropped frames give their buffer back to the source
+        decode_queue = StageQueue(self.queue_size, drop_oldest=self.drop_frames,
+                                  on_drop=lambda item: self.cap.release_frame(item[0]))
+        detect_queue = StageQueue(self.queue_size)
+        render_queue = StageQueue(self.queue_size)
+        stages = [
+            threading.Thread(target=self._decode_stage, args=(decode_queue, stop_event), daemon=True),
+            threading.Thread(target=self._detect_stage, args=(decode_queue, detect_queue, stop_event), daemon=True),
+            threading.Thread(target=self._track_stage, args=(detect_queue, render_queue, stop_event), daemon=True),
+        ]
+
+        print("Starting threaded ReID pipeline...")
+        print(f"Video FPS: {self.fps}")
+        print("=" * 50)
+        self._open_writer()
+        st_time = time.time()
+        for stage in stages:
+            stage.start()
+
+        num_frames = 0
+        while True:
+            item = render_queue.get_item(stop_event)
+            if item is END_OF_STREAM:
+                break
+            frame, draw_items = item
+            num_frames += 1
+            if self._render(frame, draw_items):
+                break
+
+        stop_event.set()
+        # the decoder may wait for a buffer that the stopped stages will not give back
+        self.cap.interrupt()
+        for stage in stages:
+            stage.join()
+        if decode_queue.num_dropped:
+            print(f"[INFO] Dropped {decode_queue.num_dropped} frames")
+        self._close(num_frames, time.time() - st_time)
 
-        while self.cap.isOpened():
+    def _decode_stage(self, out_queue: StageQueue, stop_event: threading.Event):
+        frame_count = 0
+        while self.cap.isOpened() and not stop_event.is_set():
             ret, frame = self.cap.read()
             if not ret:
                 break
-
             frame_count += 1
-            cur_time = start_time + datetime.timedelta(seconds=frame_count/self.fps)
-            print(f'[INFO] Processing frame {frame_count}')
-            l_bboxes = self.detector.detect(frame)
-            dets = np.array([list(map(int, bbox)) for bbox in l_bboxes])
-            alive_tracks, alive_indices, dead_tracks = self.tracker.update(dets)
-            dict_tracks = self.track_manager.update_session_tracks(alive_tracks, dead_tracks, frame, frame_count, cur_time)
-            for track in dict_tracks.values():
-                if track.is_dead:
-                    continue
-                x1, y1, x2, y2 = map(int, track.bboxes[-1])
-                track_id = int(track.track_id)
-
-                # Vẽ bounding box
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color=(0, 255, 0), thickness=2)
-
-                # Vẽ ID người
-                text = f"ID: {track_id}"
-                cv2.putText(frame, text, (x1, y1 - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 
-                            0.6, (0, 255, 0), 2)
-            
-            cv2.imshow("Tracking", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            cur_time = self.start_time + datetime.timedelta(seconds=frame_count/self.fps)
+            out_queue.put_item((frame, frame_count, cur_time), stop_event)
+        out_queue.put_item(END_OF_STREAM, stop_event)
+
+    def _detect_stage(self, in_queue: StageQueue, out_queue: StageQueue, stop_event: threading.Event):
+        is_ended = False
+        while not is_ended:
+            batch, is_ended = in_queue.get_batch(self.detect_batch_size, self.detect_batch_timeout, stop_event)
+            if not batch:
                 break
-        
+            l_batch_bboxes = self._detect_batch([frame for frame, _, _ in batch])
+            for (frame, frame_count, cur_time), l_bboxes in zip(batch, l_batch_bboxes):
+                print(f'[INFO] Processing frame {frame_count}')
+                out_queue.put_item((l_bboxes, frame, frame_count, cur_time), stop_event)
+        out_queue.put_item(END_OF_STREAM, stop_event)
+
+    def _track_stage(self, in_queue: StageQueue, out_queue: StageQueue, stop_event: threading.Event):
+        while True:
+            item = in_queue.get_item(stop_event)
+            if item is END_OF_STREAM:
+                break
+            l_bboxes, frame, frame_count, cur_time = item
+            draw_items = self._track(l_bboxes, frame, frame_count, cur_time)
+            out_queue.put_item((frame, draw_items), stop_event)
+        out_queue.put_item(END_OF_STREAM, stop_event)
+
+    def _detect_batch(self, frames) -> List:
+        """Detect the frames, SCHEDULED for every frame when the scheduler is enabled."""
+        if self.scheduler.enable:
+            # the scheduler needs the tracker state of the frame, only known once the previous
+            # frames are tracked: it decides and detects frame by frame in _track
+            return [SCHEDULED] * len(frames)
+        return self.detector.detect_batch(frames)
+
+    def _track(self, l_bboxes, frame, frame_count, cur_time) -> List:
+        """Update tracker and track manager, returns the (bbox, track_id) of alive tracks to draw."""
+        if l_bboxes is SCHEDULED:
+            # None: tracker-only frame
+            l_bboxes = self.detector.detect_batch([frame])[0] if self.scheduler.should_detect(frame, self.tracker) else None
+        if l_bboxes is None:
+            # tracker-only frame: draw the Kalman predictions, the track manager keeps its last boxes
+            alive_tracks = self.tracker.predict()
+            return [(list(map(int, alive_track[:4])), int(alive_track[-1])) for alive_track in alive_tracks]
+
+        dets = l_bboxes.astype(int)
+        alive_tracks, alive_indices, dead_tracks = self.tracker.update(dets)
+        dict_tracks = self.track_manager.update_session_tracks(alive_tracks, dead_tracks, frame, frame_count, cur_time)
+        draw_items = []
+        for track in dict_tracks.values():
+            if track.is_dead:
+                continue
+            draw_items.append((list(map(int, track.bboxes[-1])), int(track.track_id)))
+        return draw_items
+
+    def _render(self, frame, draw_items: List) -> bool:
+        """
+        Draw, show and write the frame, then give its buffer back to the source.
+        Returns True when the user asked to stop.
+        """
+        # headless without output: nothing would ever see the drawing
+        if not self.render or (self.writer is None and not self.display):
+            self.cap.release_frame(frame)
+            return False
+        self._draw(frame, draw_items)
+        is_stopped = False
+        if self.display:
+            cv2.imshow("Tracking", frame)
+            is_stopped = cv2.waitKey(1) & 0xFF == ord('q')
+        if self.writer is not None:
+            # given back by the writer thread once encoded
+            self.writer.write(frame, self.cap.release_frame)
+        else:
+            self.cap.release_frame(frame)
+        return is_stopped
+
+    def _open_writer(self):
+        if self.out_video:
+            self.writer = AsyncVideoWriter(self.out_video, self.fps, (self.cap.width, self.cap.height), self.writer_queue_size)
+
+    def _close(self, num_frames: int, elapsed: float):
         self.cap.release()
-        cv2.destroyAllWindows()
-    
+        self.track_manager.close()
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+            print(f"[INFO] Saved {self.out_video}")
+        if self.render and self.display:
+            cv2.destroyAllWindows()
+        print(f"[INFO] Processed {num_frames} frames in {elapsed:.1f}s ({num_frames / max(elapsed, 1e-6):.1f} FPS)")
+
+    def _draw(self, frame, draw_items: List):
+        for (x1, y1, x2, y2), track_id in draw_items:
+            # Vẽ bounding box
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color=(0, 255, 0), thickness=2)
+
+            # Vẽ ID người
+            text = f"ID: {track_id}"
+            cv2.putText(frame, text, (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.6, (0, 255, 0), 2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SCT ReID pipeline')
+    parser.add_argument('--config', default='../cfg/cfg.yaml')
+    parser.add_argument('--source', help='video file, rtsp/ffmpeg url or glob of images, overrides SOURCE.path')
+    parser.add_argument('--source-type', choices=['file', 'ffmpeg', 'images'], help='overrides SOURCE.type')
+    parser.add_argument('--mode', choices=['sequential', 'threaded'], help='overrides PIPELINE.mode')
+    parser.add_argument('--headless', action='store_true', help='no cv2 window, for servers without display')
+    parser.add_argument('--output', help='annotated output video, overrides VIZ.out_video')
+    parser.add_argument('--no-render', action='store_true', help='skip drawing, display and output video')
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    config = load_config('../cfg/cfg.yaml')
+    args = parse_args()
+    config = load_config(args.config)
+    source_cfg = config.setdefault("SOURCE", {})
+    if args.source:
+        source_cfg["path"] = args.source
+    if args.source_type:
+        source_cfg["type"] = args.source_type
+    if args.mode:
+        config.setdefault("PIPELINE", {})["mode"] = args.mode
+    viz_cfg = config.setdefault("VIZ", {})
+    if args.headless:
+        viz_cfg["display"] = False
+    if args.output:
+        viz_cfg["out_video"] = args.output
+    if args.no_render:
+        viz_cfg["enable"] = False
     sct_reid = SCRReid(config)
     sct_reid.run()
-            
+
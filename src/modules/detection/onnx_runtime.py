@@ -0,0 +1,89 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+import onnxruntime
+
+from modules.detection.utils import letterbox, nms
+
+MAX_WH = 7680  # class offset of the class-aware NMS
+
+_PROVIDERS = {
+    'cpu': 'CPUExecutionProvider',
+    'openvino': 'OpenVINOExecutionProvider',
+}
+
+
+def export_onnx(model_path: str) -> str:
+    """
+    Export the ultralytics weights to ONNX once, cached next to the weights as <name>.onnx.
+    Returns the path of the ONNX model.
+    """
+    if model_path.endswith('.onnx'):
+        return model_path
+    onnx_path = os.path.splitext(model_path)[0] + '.onnx'
+    if not os.path.exists(onnx_path):
+        from ultralytics import YOLO
+        print(f"[Yolov11Detector] Exporting {model_path} to {onnx_path}")
+        onnx_path = YOLO(model_path).export(format='onnx', dynamic=True, simplify=True)
+    return onnx_path
+
+
+class Network:
+    """
+    YOLOv11 detection model on ONNX Runtime: letterbox preprocessing, one session run per
+    batch and NumPy decoding + NMS. Returns per image (N, 6) [x1, y1, x2, y2, score, class]
+    arrays like the ultralytics `boxes.data`.
+    """
+    def __init__(self, onnx_cfg: Dict):
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = onnx_cfg.get("num_threads", 0)
+        provider = _PROVIDERS[onnx_cfg.get("provider", "cpu")]
+        self.session = onnxruntime.InferenceSession(
+            export_onnx(onnx_cfg["model_path"]),
+            sess_options=options,
+            providers=[provider, 'CPUExecutionProvider'] if provider != 'CPUExecutionProvider' else [provider]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, imgs_bgr: List[np.ndarray], imgsz: int, conf: float, iou: float, classes, max_det: int) -> List[np.ndarray]:
+        batch, ratios, pads = [], [], []
+        for img_bgr in imgs_bgr:
+            img, ratio, pad = letterbox(img_bgr, imgsz)
+            batch.append(img[:, :, ::-1].transpose(2, 0, 1))
+            ratios.append(ratio)
+            pads.append(pad)
+        batch = np.ascontiguousarray(np.stack(batch), dtype=np.float32) / 255.
+        outputs = self.session.run(None, {self.input_name: batch})[0]  # (B, 4 + num_classes, num_anchors)
+
+        return [
+            self._decode(output.T, ratio, pad, img_bgr.shape[:2], conf, iou, classes, max_det)
+            for output, ratio, pad, img_bgr in zip(outputs, ratios, pads, imgs_bgr)
+        ]
+
+    def _decode(self, output, ratio, pad, img_shape, conf, iou, classes, max_det) -> np.ndarray:
+        scores = output[:, 4:]
+        if classes is not None:
+            class_mask = np.zeros(scores.shape[1], dtype=bool)
+            class_mask[classes] = True
+            scores = np.where(class_mask, scores, 0.)
+        cls = scores.argmax(axis=1)
+        score = scores[np.arange(len(scores)), cls]
+        keep = score > conf
+        if not np.any(keep):
+            return np.empty((0, 6), dtype=np.float32)
+
+        cx, cy, w, h = output[keep, :4].T
+        dets = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2, score[keep], cls[keep]], axis=1)
+        # class-aware NMS: shift the boxes of every class apart
+        shifted = dets.copy()
+        shifted[:, :4] += dets[:, 5:6] * MAX_WH
+        dets = dets[nms(shifted, iou)[:max_det]]
+
+        # back to the original image coordinates
+        dets[:, [0, 2]] = (dets[:, [0, 2]] - pad[0]) / ratio
+        dets[:, [1, 3]] = (dets[:, [1, 3]] - pad[1]) / ratio
+        dets[:, [0, 2]] = dets[:, [0, 2]].clip(0, img_shape[1])
+        dets[:, [1, 3]] = dets[:, [1, 3]].clip(0, img_shape[0])
+        return dets.astype(np.float32)
@@ -0,0 +1,55 @@
+from typing import Dict
+
+import cv2
+import numpy as np
+
+from modules.tracker.sort import Sort
+
+
+class DetectionScheduler:
+    """Decides per frame whether the detector runs or the tracker alone serves the frame.
+
+    Detection is forced on the first frame, on motion since the last detected frame, when the
+    position of a track matched at the last detection gets too uncertain, and at least every `detect_interval` frames while
+    tracks are alive (`idle_interval` frames on an empty scene).
+    """
+    def __init__(self, scheduler_cfg: Dict):
+        self.enable = scheduler_cfg.get("enable", False)
+        self.detect_interval = scheduler_cfg.get("detect_interval", 5)
+        self.idle_interval = scheduler_cfg.get("idle_interval", 150)
+        self.motion_thresh = scheduler_cfg.get("motion_thresh", 0.01)
+        self.pixel_diff_thresh = scheduler_cfg.get("pixel_diff_thresh", 25)
+        self.max_track_uncertainty = scheduler_cfg.get("max_track_uncertainty", 20)
+        self.motion_size = tuple(scheduler_cfg.get("motion_size", [160, 90]))  # (w, h)
+
+        self.ref_gray = None
+        self.num_skipped = 0
+
+    def should_detect(self, frame, tracker: Sort) -> bool:
+        if not self.enable:
+            return True
+
+        gray = cv2.cvtColor(cv2.resize(frame, self.motion_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        is_detect = self.ref_gray is None or self._motion_ratio(gray) > self.motion_thresh
+
+        max_interval = self.detect_interval if len(tracker.trackers) > 0 else self.idle_interval
+        if self.num_skipped + 1 >= max_interval:
+            is_detect = True
+        # only the tracks matched at the last detection serve the skipped frames, the lost ones
+        # coasting through max_age get more uncertain every frame and would force detection
+        is_served = np.array([trk.time_since_update == 0 for trk in tracker.trackers], dtype=bool)
+        if is_served.any() and tracker.filters.position_std()[is_served].max() > self.max_track_uncertainty:
+            is_detect = True
+
+        if is_detect:
+            # motion is measured against the last detected frame
+            self.ref_gray = gray
+            self.num_skipped = 0
+        else:
+            self.num_skipped += 1
+        return is_detect
+
+    def _motion_ratio(self, gray) -> float:
+        diff = cv2.absdiff(gray, self.ref_gray)
+        return float(np.count_nonzero(diff > self.pixel_diff_thresh)) / diff.size
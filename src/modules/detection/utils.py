@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+
+def _intersections(boxes, i, rest):
+    w = np.maximum(0., np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]))
+    h = np.maximum(0., np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]))
+    return w * h
+
+
+def nms(boxes, iou_thresh):
+    """Greedy NMS on (N, >=5) [x1, y1, x2, y2, score, ...] boxes, returns the kept indices by score."""
+    order = np.argsort(-boxes[:, 4], kind='stable')
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while len(order) > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter = _intersections(boxes, i, rest)
+        iou = inter / (areas[i] + areas[rest] - inter)
+        order = rest[iou <= iou_thresh]
+    return np.array(keep, dtype=int)
+
+
+def tile_nms(boxes, sources, bands, iou_thresh, ios_thresh):
+    """
+    Greedy NMS merging the boxes of overlapping tiles, returns the kept indices by score, then area.
+    Boxes are suppressed by IoU, and also by intersection over the smaller area when the two
+    boxes come from different tiles / passes (`sources`, one id per box) and both lie across
+    the same overlap band (`bands`, (B, 4) [x1, y1, x2, y2]): the piece of a person cut at a
+    tile seam is nested in its whole box, while nested persons elsewhere are kept.
+    """
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    # on equal scores the larger box first, not the piece cut at the seam
+    order = np.lexsort((-areas, -boxes[:, 4]))
+    bands = np.asarray(bands, dtype=np.float32).reshape(-1, 4)
+    # (N, B) whether each box crosses each overlap band
+    across = ((boxes[:, None, 0] < bands[None, :, 2]) & (boxes[:, None, 2] > bands[None, :, 0]) &
+              (boxes[:, None, 1] < bands[None, :, 3]) & (boxes[:, None, 3] > bands[None, :, 1]))
+    keep = []
+    while len(order) > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter = _intersections(boxes, i, rest)
+        iou = inter / (areas[i] + areas[rest] - inter)
+        ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        is_seam = (sources[rest] != sources[i]) & (across[rest] & across[i]).any(axis=1)
+        order = rest[(iou <= iou_thresh) & ~(is_seam & (ios > ios_thresh))]
+    return np.array(keep, dtype=int)
+
+
+def letterbox(img, imgsz, pad_value=114):
+    """
+    Resize img keeping its aspect ratio and pad it to a centred imgsz x imgsz square.
+    Returns the padded image, the resize ratio and the (x, y) padding.
+    """
+    h, w = img.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(pad_value,) * 3)
+    return img, ratio, (left, top)
@@ -1,9 +1,22 @@
-from typing import Dict
+from typing import Dict, List
+import math
+import numpy as np
 from ultralytics import YOLO
 
+from modules.detection.utils import nms, tile_nms
+
+STRIDE = 32
+
 class Yolov11Detector:
     def __init__(self, detection_cfg: Dict, crop_roi=None):
-        self.__model = YOLO(detection_cfg["model_path"], task=detection_cfg["task"])
+        # ultralytics: torch model, onnxruntime: ONNX model exported once next to the weights
+        self.__backend = detection_cfg.get("backend", "ultralytics")
+        if self.__backend == "onnxruntime":
+            from modules.detection.onnx_runtime import Network
+            onnx_cfg = dict(detection_cfg.get("onnxruntime", {}), model_path=detection_cfg["model_path"])
+            self.__model = Network(onnx_cfg)
+        else:
+            self.__model = YOLO(detection_cfg["model_path"], task=detection_cfg["task"])
         self.__imgsz = detection_cfg["imgsz"]
         self.__conf = detection_cfg["conf_thresh"]
         self.__iou = detection_cfg["iou_thresh"]
@@ -12,16 +25,143 @@ class Yolov11Detector:
         self.__max_det = detection_cfg["max_det"]
         self.__min_obj_w = detection_cfg["min_obj_w"]
         self.__min_obj_h = detection_cfg["min_obj_h"]
-        self.__crop_roi = crop_roi
+
+        # regions [x1, y1, x2, y2] the frame is cropped to before inference,
+        # crop_roi is a single region given as [x1, x2, y1, y2]
+        rois = detection_cfg.get("rois") or []
+        if crop_roi is not None:
+            rois = [[crop_roi[0], crop_roi[2], crop_roi[1], crop_roi[3]]]
+        self.__rois = rois
+        self.__roi_groups = self._group_rois(rois)
+
+        # tiled inference: the far-field region is split into overlapping tile_size tiles
+        # inferred at their native resolution, next to the usual full frame (or ROIs) pass
+        tiling_cfg = detection_cfg.get("tiling", {})
+        self.__tiling = tiling_cfg.get("enable", False)
+        self.__tile_size = tiling_cfg.get("tile_size", self.__imgsz)
+        self.__tile_overlap = tiling_cfg.get("overlap", 0.2)
+        self.__tile_region = tiling_cfg.get("region", [0., 0., 1., 1.])
+        self.__tile_full_frame = tiling_cfg.get("full_frame", True)
+        # boxes cut at a tile seam are mostly inside the whole box: merged by intersection over smaller area
+        self.__merge_thresh = tiling_cfg.get("merge_thresh", 0.6)
+        self.__tile_groups: Dict[tuple, Dict[int, List]] = {}
+        self.__tile_bands: Dict[tuple, np.ndarray] = {}
+    
+    def _group_rois(self, rois, max_imgsz=None, roi_groups=None):
+        """Group the ROIs by the imgsz they are inferred at: their longer side, up to max_imgsz (imgsz)."""
+        max_imgsz = self.__imgsz if max_imgsz is None else max_imgsz
+        roi_groups: Dict[int, List] = {} if roi_groups is None else roi_groups
+        for x1, y1, x2, y2 in rois:
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = int(x2), int(y2)
+            imgsz = min(max_imgsz, math.ceil(max(x2 - x1, y2 - y1) / STRIDE) * STRIDE)
+            roi_groups.setdefault(imgsz, []).append((x1, y1, x2, y2))
+        return roi_groups
+    
+    def _get_tile_groups(self, img_shape):
+        """
+        ROI groups of the tiles of a frame shape (h, w), plus the full frame or ROIs pass, and the
+        (B, 4) overlap bands between neighbour tiles, cached per shape.
+        """
+        h, w = img_shape[:2]
+        if (h, w) in self.__tile_groups:
+            return self.__tile_groups[(h, w)], self.__tile_bands[(h, w)]
+
+        x1, y1, x2, y2 = (int(round(v * s)) for v, s in zip(self.__tile_region, (w, h, w, h)))
+        step = max(1, int(self.__tile_size * (1 - self.__tile_overlap)))
+        tiles = [
+            (tx, ty, min(tx + self.__tile_size, x2), min(ty + self.__tile_size, y2))
+            for ty in _tile_starts(y1, y2, self.__tile_size, step)
+            for tx in _tile_starts(x1, x2, self.__tile_size, step)
+        ]
+        bands = [
+            (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+            for k, a in enumerate(tiles) for b in tiles[k + 1:]
+            if max(a[0], b[0]) < min(a[2], b[2]) and max(a[1], b[1]) < min(a[3], b[3])
+        ]
+        roi_groups = self._group_rois(tiles, max_imgsz=math.ceil(self.__tile_size / STRIDE) * STRIDE)
+        if self.__tile_full_frame:
+            self._group_rois(self.__rois or [(0, 0, w, h)], roi_groups=roi_groups)
+        self.__tile_groups[(h, w)] = roi_groups
+        self.__tile_bands[(h, w)] = np.array(bands, dtype=np.float32).reshape(-1, 4)
+        return roi_groups, self.__tile_bands[(h, w)]
     
     def _preprocess(self, imgs_bgr):
         return imgs_bgr
     
     def detect(self, imgs_bgr):
+        if self.__roi_groups or self.__tiling:
+            return self.detect_batch([imgs_bgr])[0]
         imgs = self._preprocess(imgs_bgr)
-        predicts = self.__model(
+        predicts = self._predict(imgs)
+        return self._postprocess(predicts)
+    
+    def detect_batch(self, l_imgs_bgr: List) -> List[np.ndarray]:
+        """
+        Detect on N frames, possibly from different cameras, with one inference call.
+        Returns one (N, 5) box array per frame, in the order of l_imgs_bgr.
+        """
+        if len(l_imgs_bgr) == 0:
+            return []
+        imgs = [self._preprocess(img_bgr) for img_bgr in l_imgs_bgr]
+        if self.__tiling:
+            # frames of the same shape share their tiles and are inferred together
+            l_boxes = [None] * len(imgs)
+            shape_indices: Dict[tuple, List[int]] = {}
+            for i, img in enumerate(imgs):
+                shape_indices.setdefault(img.shape[:2], []).append(i)
+            for shape, indices in shape_indices.items():
+                roi_groups, bands = self._get_tile_groups(shape)
+                l_shape_boxes = self._detect_rois([imgs[i] for i in indices], roi_groups, bands)
+                for i, boxes in zip(indices, l_shape_boxes):
+                    l_boxes[i] = boxes
+            return l_boxes
+        if self.__roi_groups:
+            return self._detect_rois(imgs, self.__roi_groups)
+        predicts = self._predict(imgs)
+        return [self._postprocess([pred]) for pred in predicts]
+    
+    def _detect_rois(self, imgs, roi_groups, bands=None) -> List[np.ndarray]:
+        """
+        Crop every frame to the ROIs, infer the crops of the same imgsz in one call, map the
+        boxes back to frame coordinates and merge the duplicates of overlapping ROIs: by IoU,
+        and by intersection over smaller area across the tile overlap `bands` when given.
+        """
+        l_boxes = [[] for _ in imgs]
+        l_sources = [[] for _ in imgs]
+        roi_offset = 0
+        for imgsz, rois in roi_groups.items():
+            crops = [np.ascontiguousarray(img[y1:y2, x1:x2]) for img in imgs for x1, y1, x2, y2 in rois]
+            predicts = self._predict(crops, imgsz)
+            for k, pred in enumerate(predicts):
+                img_idx, roi_idx = divmod(k, len(rois))
+                boxes = self._postprocess([pred], offset=rois[roi_idx][:2])
+                l_boxes[img_idx].append(boxes)
+                l_sources[img_idx].append(np.full(len(boxes), roi_offset + roi_idx))
+            roi_offset += len(rois)
+
+        l_boxes = [np.concatenate(boxes, axis=0) for boxes in l_boxes]
+        if roi_offset > 1:
+            if bands is None:
+                l_boxes = [boxes[nms(boxes, self.__iou)] for boxes in l_boxes]
+            else:
+                l_boxes = [
+                    boxes[tile_nms(boxes, np.concatenate(sources), bands, self.__iou, self.__merge_thresh)]
+                    for boxes, sources in zip(l_boxes, l_sources)
+                ]
+        return l_boxes
+    
+    def _predict(self, imgs, imgsz=None) -> List[np.ndarray]:
+        """Returns one (N, 6) [x1, y1, x2, y2, score, class] array per image."""
+        imgsz = self.__imgsz if imgsz is None else imgsz
+        if self.__backend == "onnxruntime":
+            if not isinstance(imgs, list):
+                imgs = [imgs]
+            return self.__model(imgs, imgsz, self.__conf, self.__iou, self.__classes, self.__max_det)
+
+        preds = self.__model(
             source=imgs,
-            imgsz=self.__imgsz,
+            imgsz=imgsz,
             conf=self.__conf,
             iou=self.__iou,
             device=self.__device,
@@ -29,23 +169,32 @@ class Yolov11Detector:
             max_det=self.__max_det,
             verbose=False
         )
-        return self._postprocess(predicts)
+        # a single device->host copy per frame
+        return [pred.boxes.data.cpu().numpy() for pred in preds]
     
-    def _postprocess(self, preds):
+    def _postprocess(self, preds, offset=None):
+        """
+        Returns the boxes of all preds as one (N, 5) float32 array of [x1, y1, x2, y2, score],
+        shifted by offset (x, y) when the preds come from a crop.
+        """
         l_boxes = []
         for pred in preds:
-            boxes = []
-            for box in pred.boxes.data:
-                x1, y1, x2, y2, sc, cl = box.cpu().numpy().tolist()
-                w = (x2 - x1)
-                h = (y2 - y1)
-                if w < self.__min_obj_w: continue
-                if h < self.__min_obj_h: continue
-                if self.__crop_roi is not None:
-                    x1 = x1 + self.__crop_roi[0]
-                    y1 = y1 + self.__crop_roi[2]
-                    x2 = x2 + self.__crop_roi[0]
-                    y2 = y2 + self.__crop_roi[2]
-                l_boxes.append([x1, y1, x2, y2, sc])
-                # l_boxes.append([x1, y1, x2, y2])
-        return l_boxes
\ No newline at end of file
+            boxes = pred.astype(np.float32)
+            w = boxes[:, 2] - boxes[:, 0]
+            h = boxes[:, 3] - boxes[:, 1]
+            boxes = boxes[(w >= self.__min_obj_w) & (h >= self.__min_obj_h), :5]
+            if offset is not None:
+                boxes[:, [0, 2]] += offset[0]
+                boxes[:, [1, 3]] += offset[1]
+            l_boxes.append(boxes)
+        if not l_boxes:
+            return np.empty((0, 5), dtype=np.float32)
+        return np.concatenate(l_boxes, axis=0)
+
+
+def _tile_starts(start, end, tile_size, step):
+    """Start coordinates of the tiles covering [start, end), the last tile ends at end."""
+    if end - start <= tile_size:
+        return [start]
+    starts = list(range(start, end - tile_size, step))
+    return starts + [end - tile_size]
@@ -0,0 +1,21 @@
+from typing import Dict
+
+from .base import IEmbedding
+
+
+def build_embedding(vec_config: Dict) -> IEmbedding:
+    """
+    The embedder selected by `name` in the VECTORIZATION config, built from the block of the same name:
+        fast_reid: FastReID on PyTorch
+        fast_reid_onnx: FastReID exported to ONNX, on ONNX Runtime CPU
+    """
+    name = vec_config.get("name", "fast_reid")
+    # imported on demand, onnxruntime is only needed by the ONNX embedder
+    if name == "fast_reid":
+        from .fastreid.embed import Embedding
+    elif name == "fast_reid_onnx":
+        from .fastreid_onnx.embed import Embedding
+    else:
+        raise ValueError(f"Unknown embedding {name}, expected fast_reid or fast_reid_onnx")
+    print(f"[Embedding] Using {name}")
+    return Embedding(vec_config[name])
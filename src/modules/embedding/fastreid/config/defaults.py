@@ -147,6 +147,8 @@ _C.INPUT = CN()
 _C.INPUT.SIZE_TRAIN = [256, 128]
 # Size of the image during test
 _C.INPUT.SIZE_TEST = [256, 128]
+# Interpolation of the crops resized to SIZE_TEST at inference: nearest, linear, cubic or area
+_C.INPUT.INTERPOLATION = "cubic"
 
 # `True` if cropping is used for data augmentation during training
 _C.INPUT.CROP = CN({"ENABLED": False})
@@ -312,6 +314,12 @@ _C.TEST.RERANK.K1 = 20
 _C.TEST.RERANK.K2 = 6
 _C.TEST.RERANK.LAMBDA = 0.3
 
+# Fold the pixel normalisation into the stem conv of the DefaultPredictor model
+_C.TEST.FOLD_PIXEL_NORM = True
+
+# Fold the eval-mode BN layers into their preceding conv of the DefaultPredictor model
+_C.TEST.FUSE_CONV_BN = True
+
 # Precise batchnorm
 _C.TEST.PRECISE_BN = CN({"ENABLED": False})
 _C.TEST.PRECISE_BN.DATASET = 'Market1501'
@@ -1,6 +1,7 @@
 from yacs.config import CfgNode
 import yaml
 import cv2
+import numpy as np
 import torch
 import torch.nn.functional as F
 
@@ -8,6 +9,49 @@ from .engine import DefaultPredictor
 from .config import get_cfg
 from ..base import IEmbedding
 
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "area": cv2.INTER_AREA,
+}
+
+
+def resize_crops(imgs_bgr, buffer: np.ndarray, interpolation, alloc=None) -> np.ndarray:
+    """
+    Resize the crops into the (M, H, W, 3) uint8 buffer, returns the view of its first N crops.
+    When the buffer is too small `alloc(size)` returns a new one of `size` crops, at least doubled.
+    """
+    num_imgs = len(imgs_bgr)
+    if num_imgs > len(buffer):
+        buffer = alloc(max(num_imgs, 2 * len(buffer)))
+    h, w = buffer.shape[1:3]
+    crops = buffer[:num_imgs]
+    for crop, img_bgr in zip(crops, imgs_bgr):
+        # crops from the track manager are already at the test size
+        if img_bgr.shape[:2] == (h, w):
+            crop[:] = img_bgr
+        else:
+            cv2.resize(img_bgr, (w, h), dst=crop, interpolation=interpolation)
+    return crops
+
+
+def load_cfg(cfg_dict):
+    """
+    Args:
+        cfg_dict: dict hoặc string (đường dẫn tới file YAML của FastReID)
+    Returns:
+        the FastReID config, the defaults overridden by `cfg_dict`
+    """
+    if isinstance(cfg_dict, str):
+        print(f"[Embedding] Loading config from {cfg_dict}")
+        with open(cfg_dict, "r") as f:
+            cfg_dict = yaml.safe_load(f)
+
+    cfg = get_cfg()
+    cfg.merge_from_other_cfg(CfgNode(cfg_dict))
+    return cfg
+
 
 class Embedding(IEmbedding):
     def __init__(self, cfg_dict):
@@ -15,31 +59,43 @@ class Embedding(IEmbedding):
         Args:
             cfg_dict: dict hoặc string (đường dẫn tới file YAML của FastReID)
         """
-        if isinstance(cfg_dict, str):
-            print(f"[Embedding] Loading config from {cfg_dict}")
-            with open(cfg_dict, "r") as f:
-                cfg_dict = yaml.safe_load(f)
+        self.cfg = load_cfg(cfg_dict)
+        # with the pixel normalisation folded the model takes the uint8 BGR crops as they are
+        self.predictor = DefaultPredictor(self.cfg, input_bgr=True)
 
-        self.cfg = get_cfg()
-        self.cfg.merge_from_other_cfg(CfgNode(cfg_dict))
-        self.predictor = DefaultPredictor(self.cfg)
+        self.size_test = tuple(self.cfg.INPUT.SIZE_TEST)  # (h, w)
+        self.interpolation = INTERPOLATIONS[self.cfg.INPUT.INTERPOLATION]
+        # pinned host memory for the host->device copy of the batch
+        self.pin_memory = torch.cuda.is_available() and self.cfg.MODEL.DEVICE.startswith("cuda")
+        self._alloc_buffers(0)
+
+    def _alloc_buffers(self, batch_size):
+        """uint8 crops resized in place and the float32 model input, reused by every batch. Returns the crops."""
+        h, w = self.size_test
+        self.crops_tensor = torch.empty((batch_size, h, w, 3), dtype=torch.uint8, pin_memory=self.pin_memory)
+        self.crops_buffer = self.crops_tensor.numpy()
+        if not self.predictor.is_folded:
+            self.input_buffer = torch.empty((batch_size, 3, h, w), dtype=torch.float32, pin_memory=self.pin_memory)
+        return self.crops_buffer
 
     def _preprocess(self, imgs_bgr):
+        """
+        Returns the (N, 3, H, W) batch, uint8 BGR when the model folded the pixel normalisation,
+        float32 RGB otherwise. It is a view of the buffers overwritten by the next call.
+        """
         if not isinstance(imgs_bgr, list): 
             imgs_bgr = [imgs_bgr]
 
-        images = []
-        for img_bgr in imgs_bgr:
-            img_rgb = img_bgr[:, :, ::-1]
-            image = cv2.resize(
-                img_rgb,
-                tuple(self.cfg.INPUT.SIZE_TEST[::-1]),
-                interpolation=cv2.INTER_CUBIC
-            )
-            image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))[None]
-            images.append(image)
-            
-        imgs = torch.cat(images, dim=0)
+        crops = resize_crops(imgs_bgr, self.crops_buffer, self.interpolation, self._alloc_buffers)
+        num_imgs = len(crops)
+
+        if self.predictor.is_folded:
+            # the stem conv copies, casts and flips the channels
+            return self.crops_tensor[:num_imgs].permute(0, 3, 1, 2)
+
+        # a single pass over the batch: BGR->RGB, HWC->CHW and uint8->float32
+        imgs = self.input_buffer[:num_imgs]
+        np.copyto(imgs.numpy(), crops[..., ::-1].transpose(0, 3, 1, 2))
         return imgs
     
     def extract_feature(self, imgs_bgr):
@@ -18,6 +18,7 @@ import torch
 from torch.nn.parallel import DistributedDataParallel
 
 from ..modeling.meta_arch import build_model
+from ..modeling.inference import fold_pixel_norm, fuse_for_inference
 from ..utils import comm
 from ..utils.checkpoint import Checkpointer
 from ..utils.collect_env import collect_env_info
@@ -127,7 +128,12 @@ class DefaultPredictor:
         outputs = pred(inputs)
     """
 
-    def __init__(self, cfg):
+    def __init__(self, cfg, input_bgr=False):
+        """
+        Args:
+            input_bgr (bool): images are given in BGR order, only possible once the pixel
+                normalisation is folded (`is_folded`), which then also flips the channels.
+        """
         self.cfg = cfg.clone()  # cfg can be modified by model
         self.cfg.defrost()
         self.cfg.MODEL.BACKBONE.PRETRAIN = False
@@ -136,14 +142,23 @@ class DefaultPredictor:
 
         Checkpointer(self.model).load(cfg.MODEL.WEIGHTS)
 
+        if cfg.TEST.FUSE_CONV_BN:
+            fuse_for_inference(self.model)
+        self.is_folded = bool(cfg.TEST.FOLD_PIXEL_NORM) and fold_pixel_norm(self.model, input_bgr)
+
     def __call__(self, image):
         """
         Args:
-            image (torch.tensor): an image tensor of shape (B, C, H, W).
+            image (torch.tensor): an image tensor of shape (B, C, H, W), float or uint8, it is
+                not modified.
         Returns:
             predictions (torch.tensor): the output features of the model
         """
-        inputs = {"images": image.to(self.model.device)}
+        if self.is_folded:
+            # the folded stem conv copies the images to the model device itself
+            inputs = {"images": image}
+        else:
+            inputs = {"images": image.to(self.model.device)}
         with torch.no_grad():  # https://github.com/sphinx-doc/sphinx/issues/4258
             predictions = self.model(inputs)
         return predictions
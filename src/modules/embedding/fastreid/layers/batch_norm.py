@@ -10,7 +10,7 @@ import torch
 import torch.nn.functional as F
 from torch import nn
 
-__all__ = ["IBN", "get_norm"]
+__all__ = ["IBN", "get_norm", "fuse_conv_bn", "fuse_conv_bn_"]
 
 
 class BatchNorm(nn.BatchNorm2d):
@@ -203,3 +203,50 @@ def get_norm(norm, out_channels, **kwargs):
             "GN": lambda channels, **args: nn.GroupNorm(32, channels),
         }[norm]
     return norm(out_channels, **kwargs)
+
+
+def fuse_conv_bn(conv, norm):
+    """
+    Fold an eval-mode batch norm into the preceding convolution.
+    Args:
+        conv (nn.Conv2d): the convolution feeding `norm`
+        norm (nn.Module): BatchNorm/SyncBatchNorm/GhostBatchNorm/FrozenBatchNorm
+    Returns:
+        nn.Conv2d or None: a conv with bias computing `norm(conv(x))`, or None when `norm`
+            normalises with the input statistics (InstanceNorm, IBN, GN) or is training
+    """
+    bn_module = nn.modules.batchnorm
+    if isinstance(norm, (bn_module.BatchNorm2d, bn_module.SyncBatchNorm)):
+        if norm.training or norm.running_mean is None:
+            return None
+    elif not isinstance(norm, FrozenBatchNorm):
+        return None
+
+    with torch.no_grad():
+        std = (norm.running_var + norm.eps).sqrt()
+        gamma = norm.weight if norm.weight is not None else torch.ones_like(std)
+        beta = norm.bias if norm.bias is not None else torch.zeros_like(std)
+        t = gamma / std
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(std)
+
+        fused = nn.Conv2d(
+            conv.in_channels, conv.out_channels, conv.kernel_size, stride=conv.stride, padding=conv.padding,
+            dilation=conv.dilation, groups=conv.groups, bias=True, padding_mode=conv.padding_mode,
+        ).to(device=conv.weight.device, dtype=conv.weight.dtype)
+        fused.weight.copy_(conv.weight * t.reshape(-1, 1, 1, 1))
+        fused.bias.copy_(beta + (bias - norm.running_mean) * t)
+    fused.requires_grad_(False)
+    return fused
+
+
+def fuse_conv_bn_(module, conv_name, norm_name):
+    """
+    In-place version of `fuse_conv_bn` on two children of `module`, the norm is replaced
+    by an Identity. Returns the number of fused pairs (0 or 1).
+    """
+    fused = fuse_conv_bn(getattr(module, conv_name), getattr(module, norm_name))
+    if fused is None:
+        return 0
+    setattr(module, conv_name, fused)
+    setattr(module, norm_name, nn.Identity())
+    return 1
@@ -12,7 +12,7 @@ import logging
 import torch
 from torch import nn
 
-from ...layers.batch_norm import get_norm
+from ...layers.batch_norm import get_norm, fuse_conv_bn_
 from ...utils import comm
 from ...utils.checkpoint import get_missing_parameters_message, get_unexpected_parameters_message
 from .build import BACKBONE_REGISTRY
@@ -65,6 +65,9 @@ class ConvLayer(nn.Module):
             self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU(inplace=True)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -89,6 +92,9 @@ class Conv1x1(nn.Module):
         self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU(inplace=True)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -106,6 +112,9 @@ class Conv1x1Linear(nn.Module):
         )
         self.bn = get_norm(bn_norm, out_channels)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -129,6 +138,9 @@ class Conv3x3(nn.Module):
         self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU(inplace=True)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -158,6 +170,9 @@ class LightConv3x3(nn.Module):
         self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU(inplace=True)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv2', 'bn')
+
     def forward(self, x):
         x = self.conv1(x)
         x = self.conv2(x)
@@ -10,7 +10,7 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 
-from ...layers import get_norm
+from ...layers import get_norm, fuse_conv_bn_
 from ...utils import comm
 from ...utils.checkpoint import get_missing_parameters_message, get_unexpected_parameters_message
 from .build import BACKBONE_REGISTRY
@@ -62,6 +62,9 @@ class ConvLayer(nn.Module):
             self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU(inplace=True)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -86,6 +89,9 @@ class Conv1x1(nn.Module):
         self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU()
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -103,6 +109,9 @@ class Conv1x1Linear(nn.Module):
         )
         self.bn = get_norm(bn_norm, out_channels)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -126,6 +135,9 @@ class Conv3x3(nn.Module):
         self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU(inplace=True)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv', 'bn')
+
     def forward(self, x):
         x = self.conv(x)
         x = self.bn(x)
@@ -155,6 +167,9 @@ class LightConv3x3(nn.Module):
         self.bn = get_norm(bn_norm, out_channels)
         self.relu = nn.ReLU(inplace=True)
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv2', 'bn')
+
     def forward(self, x):
         x = self.conv1(x)
         x = self.conv2(x)
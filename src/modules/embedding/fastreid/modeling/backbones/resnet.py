@@ -15,6 +15,7 @@ from ...layers import (
     SELayer,
     Non_local,
     get_norm,
+    fuse_conv_bn_,
 )
 from ...utils.checkpoint import get_missing_parameters_message, get_unexpected_parameters_message
 from .build import BACKBONE_REGISTRY
@@ -56,6 +57,13 @@ class BasicBlock(nn.Module):
         self.downsample = downsample
         self.stride = stride
 
+    def fuse_for_inference(self):
+        # bn1 stays unfused when it is an IBN
+        num_fused = fuse_conv_bn_(self, 'conv1', 'bn1') + fuse_conv_bn_(self, 'conv2', 'bn2')
+        if self.downsample is not None:
+            num_fused += fuse_conv_bn_(self.downsample, '0', '1')
+        return num_fused
+
     def forward(self, x):
         identity = x
 
@@ -100,6 +108,14 @@ class Bottleneck(nn.Module):
         self.downsample = downsample
         self.stride = stride
 
+    def fuse_for_inference(self):
+        # bn1 stays unfused when it is an IBN
+        num_fused = fuse_conv_bn_(self, 'conv1', 'bn1') + fuse_conv_bn_(self, 'conv2', 'bn2') + \
+                    fuse_conv_bn_(self, 'conv3', 'bn3')
+        if self.downsample is not None:
+            num_fused += fuse_conv_bn_(self.downsample, '0', '1')
+        return num_fused
+
     def forward(self, x):
         residual = x
 
@@ -146,6 +162,9 @@ class ResNet(nn.Module):
         else:       self.NL_1_idx = self.NL_2_idx = self.NL_3_idx = self.NL_4_idx = []
         # fmt: on
 
+    def fuse_for_inference(self):
+        return fuse_conv_bn_(self, 'conv1', 'bn1')
+
     def _make_layer(self, block, planes, blocks, stride=1, bn_norm="BN", with_ibn=False, with_se=False):
         downsample = None
         if stride != 1 or self.inplanes != planes * block.expansion:
@@ -116,6 +116,12 @@ class EmbeddingHead(nn.Module):
             'norm_type': norm_type
         }
 
+    def fuse_for_inference(self):
+        # neck is (conv, bnneck) when both embedding_dim > 0 and with_bnneck
+        if len(self.bottleneck) == 2:
+            return fuse_conv_bn_(self.bottleneck, '0', '1')
+        return 0
+
     def forward(self, features, targets=None):
         """
         See :class:`ReIDHeads.forward`.
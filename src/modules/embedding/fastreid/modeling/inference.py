@@ -0,0 +1,152 @@
+# encoding: utf-8
+"""
+Inference-only rewrites of a loaded model, applied by DefaultPredictor.
+"""
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+
+class PixelNormConv2d(nn.Module):
+    """
+    Stem convolution with the pixel normalisation (and optionally the BGR->RGB flip) folded
+    into its weights and bias, it takes raw uint8 or float pixels.
+
+    The original conv zero-pads normalised images, i.e. pads raw pixels with the pixel mean,
+    so raw inputs are padded with the pixel mean here and the output is unchanged. Building
+    the padded input is the only full pass over the batch and never writes to the input.
+    """
+
+    def __init__(self, conv: nn.Conv2d, pixel_mean, pixel_std, input_bgr=False):
+        super().__init__()
+        pixel_mean = pixel_mean.detach().reshape(1, -1, 1, 1).to(conv.weight)
+        pixel_std = pixel_std.detach().reshape(1, -1, 1, 1).to(conv.weight)
+        weight = conv.weight.detach() / pixel_std
+        bias = conv.bias.detach() if conv.bias is not None else torch.zeros_like(weight[:, 0, 0, 0])
+        bias = bias - (weight * pixel_mean).sum(dim=(1, 2, 3))
+        if input_bgr:
+            weight = weight.flip(1)
+            pixel_mean = pixel_mean.flip(1)
+        self.weight = nn.Parameter(weight, requires_grad=False)
+        self.bias = nn.Parameter(bias, requires_grad=False)
+        self.register_buffer('pixel_mean', pixel_mean, False)
+        self.stride = conv.stride
+        self.padding = conv.padding
+        self.dilation = conv.dilation
+        self.groups = conv.groups
+
+    def forward(self, x):
+        ph, pw = self.padding
+        n, c, h, w = x.shape
+        padded = torch.empty((n, c, h + 2 * ph, w + 2 * pw), dtype=self.weight.dtype, device=self.weight.device)
+        # one pass: copy, cast and move to the model device
+        padded[:, :, ph:ph + h, pw:pw + w] = x
+        if ph > 0:
+            padded[:, :, :ph] = self.pixel_mean
+            padded[:, :, -ph:] = self.pixel_mean
+        if pw > 0:
+            padded[:, :, :, :pw] = self.pixel_mean
+            padded[:, :, :, -pw:] = self.pixel_mean
+        return F.conv2d(padded, self.weight, self.bias, self.stride, 0, self.dilation, self.groups)
+
+
+def _replace_module(model: nn.Module, name: str, module: nn.Module):
+    parent_name, _, child_name = name.rpartition('.')
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child_name, module)
+
+
+def fold_pixel_norm(model: nn.Module, input_bgr=False):
+    """
+    Fold `model.pixel_mean` / `model.pixel_std` into the first conv taking the 3 image
+    channels, after which `model.preprocess_image` passes the raw images through.
+
+    Returns True when the model was folded, False when it has no foldable stem conv.
+    """
+    if getattr(model, 'pixel_norm_folded', False):
+        return True
+    for name, module in model.named_modules():
+        if isinstance(module, nn.Conv2d):
+            if module.in_channels != 3 or module.groups != 1 or module.padding_mode != 'zeros':
+                return False
+            _replace_module(model, name, PixelNormConv2d(module, model.pixel_mean, model.pixel_std, input_bgr))
+            model.pixel_norm_folded = True
+            return True
+    return False
+
+
+def fuse_for_inference(model: nn.Module):
+    """
+    Fold every eval-mode batch norm into its preceding conv, through the `fuse_for_inference`
+    method of the blocks that support it (OSNet, OSNet-AIN, ResNet, EmbeddingHead), like
+    `RepVGG.deploy`. InstanceNorm and IBN use the input statistics and are left untouched.
+
+    Returns the number of fused conv+bn pairs.
+    """
+    assert not model.training, "BN can only be fused in eval mode"
+    num_fused = 0
+    for module in list(model.modules()):
+        if hasattr(module, 'fuse_for_inference'):
+            num_fused += module.fuse_for_inference()
+    return num_fused
+
+
+if __name__ == '__main__':
+    # numerical equivalence of the fused and folded models, fails on a mismatch, e.g.
+    # python -m modules.embedding.fastreid.modeling.inference ../cfg/osnet-ain_x1.0-ibn_512_256x192_ccdmmps.yaml
+    import copy
+    import os
+    import sys
+    import tempfile
+
+    from ..config import get_cfg
+    from ..engine import DefaultPredictor
+    from .meta_arch import build_model
+
+    cfg = get_cfg()
+    cfg.merge_from_file(sys.argv[1])
+    cfg.MODEL.BACKBONE.PRETRAIN = False
+    cfg.MODEL.DEVICE = 'cpu'
+    model = build_model(cfg).eval()
+    # random statistics, a fresh model has identity BNs
+    for m in model.modules():
+        if isinstance(m, (nn.BatchNorm2d, nn.InstanceNorm2d)) and m.affine:
+            m.weight.data.uniform_(0.5, 1.5)
+            m.bias.data.uniform_(-0.2, 0.2)
+        if isinstance(m, nn.BatchNorm2d):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 2.)
+
+    images = torch.randint(0, 256, (8, 3, *cfg.INPUT.SIZE_TEST), dtype=torch.uint8)
+    with torch.no_grad():
+        ref = model({"images": images.float()})
+
+    # BN fused into the convs, float RGB input
+    fused = copy.deepcopy(model)
+    num_fused = fuse_for_inference(fused)
+    num_left = sum(isinstance(m, nn.BatchNorm2d) for m in fused.modules())
+    with torch.no_grad():
+        out = fused({"images": images.float()})
+    print(f"fused {num_fused} conv+bn pairs, {num_left} BN left, max abs diff {(ref - out).abs().max().item():.3g}")
+    torch.testing.assert_close(out, ref, atol=1e-4, rtol=1e-4)
+
+    # pixel normalisation folded into the stem conv, raw uint8 RGB input
+    folded = copy.deepcopy(fused)
+    assert fold_pixel_norm(folded), "no foldable stem conv"
+    with torch.no_grad():
+        out = folded({"images": images})
+    print(f"folded pixel norm (RGB), max abs diff {(ref - out).abs().max().item():.3g}")
+    torch.testing.assert_close(out, ref, atol=1e-4, rtol=1e-4)
+
+    # the embedder's predictor: fused, folded with the BGR->RGB flip, raw uint8 BGR input
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cfg.MODEL.WEIGHTS = os.path.join(tmp_dir, "model.pth")
+        torch.save({"model": model.state_dict()}, cfg.MODEL.WEIGHTS)
+        cfg.TEST.FUSE_CONV_BN = True
+        cfg.TEST.FOLD_PIXEL_NORM = True
+        predictor = DefaultPredictor(cfg, input_bgr=True)
+    assert predictor.is_folded, "no foldable stem conv"
+    out = predictor(images.flip(1))
+    print(f"DefaultPredictor(input_bgr=True), max abs diff {(ref - out).abs().max().item():.3g}")
+    torch.testing.assert_close(out, ref, atol=1e-4, rtol=1e-4)
@@ -52,6 +52,8 @@ class Baseline(nn.Module):
 
         self.register_buffer('pixel_mean', torch.Tensor(pixel_mean).view(1, -1, 1, 1), False)
         self.register_buffer('pixel_std', torch.Tensor(pixel_std).view(1, -1, 1, 1), False)
+        # set by modeling.inference.fold_pixel_norm, the stem conv then normalises the raw images
+        self.pixel_norm_folded = False
 
     @classmethod
     def from_config(cls, cfg):
@@ -127,7 +129,10 @@ class Baseline(nn.Module):
         else:
             raise TypeError("batched_inputs must be dict or torch.Tensor, but get {}".format(type(batched_inputs)))
 
-        images.sub_(self.pixel_mean).div_(self.pixel_std)
+        if self.pixel_norm_folded:
+            return images
+        # out of place: the caller's batch (uint8 or float) is left untouched
+        images = images.sub(self.pixel_mean).div_(self.pixel_std)
         return images
 
     def losses(self, outputs, gt_labels):
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+
+from .onnx_runtime import Network
+from ..base import IEmbedding
+from ..fastreid.embed import INTERPOLATIONS, load_cfg, resize_crops
+
+
+def default_onnx_path(cfg) -> str:
+    """<MODEL.WEIGHTS without extension>.onnx, next to the weights."""
+    return os.path.splitext(cfg.MODEL.WEIGHTS)[0] + ".onnx"
+
+
+class Embedding(IEmbedding):
+    """
+    FastReID embedder on ONNX Runtime CPU, same features as `fastreid.embed.Embedding`.
+
+    cfg:
+        fast_reid: dict hoặc đường dẫn tới file YAML của FastReID (test size, interpolation, weights)
+        model_path: the ONNX model, exported from the FastReID config when missing
+            (default <MODEL.WEIGHTS>.onnx)
+        num_threads: ORT intra-op threads, 0 for the default (physical cores)
+        allow_spinning: ORT threads busy wait between ops
+        quantization: none | static, INT8 model quantized once from the FP32 one
+            (<model_path>.<mode>-int8.onnx), see quantize.py
+        calib_dir: saved person crops calibrating the static quantization
+    """
+    def __init__(self, cfg):
+        self.cfg = load_cfg(cfg["fast_reid"])
+        model_path = cfg.get("model_path") or default_onnx_path(self.cfg)
+        if not os.path.exists(model_path):
+            # the PyTorch model is only built for the first export
+            from .export import export_onnx
+            model_path = export_onnx(self.cfg, model_path)
+        quantization = cfg.get("quantization") or "none"
+        if quantization != "none":
+            model_path = self._quantize(model_path, quantization, cfg.get("calib_dir"))
+        self.model_path = model_path
+        self.network = Network(model_path, cfg.get("num_threads", 0), cfg.get("allow_spinning", True))
+
+        self.size_test = tuple(self.cfg.INPUT.SIZE_TEST)  # (h, w)
+        assert self.size_test == (self.network.input_height, self.network.input_width), \
+            f"{model_path} was exported for {self.network.input_height}x{self.network.input_width} crops"
+        self.interpolation = INTERPOLATIONS[self.cfg.INPUT.INTERPOLATION]
+        self._alloc_buffer(0)
+
+    def _quantize(self, model_path, mode, calib_dir):
+        from .quantize import MAX_CALIB_CROPS, QUANTIZATION_MODES, int8_onnx_path, list_crops, load_crops, quantize_model
+        assert mode in QUANTIZATION_MODES, f"Unknown quantization {mode}, expected none or one of {QUANTIZATION_MODES}"
+        int8_path = int8_onnx_path(model_path, mode)
+        if os.path.exists(int8_path):
+            return int8_path
+        assert calib_dir, "static quantization needs calib_dir"
+        calib_crops = load_crops(list_crops(calib_dir)[:MAX_CALIB_CROPS], self.cfg.INPUT.SIZE_TEST,
+                                 INTERPOLATIONS[self.cfg.INPUT.INTERPOLATION])
+        return quantize_model(model_path, mode, int8_path, calib_crops)
+
+    def _alloc_buffer(self, batch_size):
+        """uint8 crops resized in place, reused by every batch."""
+        self.crops_buffer = np.empty((batch_size, *self.size_test, 3), dtype=np.uint8)
+        return self.crops_buffer
+
+    def _preprocess(self, imgs_bgr):
+        """Returns the (N, H, W, 3) uint8 BGR batch, a view of the buffer overwritten by the next call."""
+        if not isinstance(imgs_bgr, list):
+            imgs_bgr = [imgs_bgr]
+        return resize_crops(imgs_bgr, self.crops_buffer, self.interpolation, self._alloc_buffer)
+
+    def extract_feature(self, imgs_bgr):
+        return self.network.inference(self._preprocess(imgs_bgr))
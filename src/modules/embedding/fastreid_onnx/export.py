@@ -0,0 +1,90 @@
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from ..fastreid.embed import load_cfg
+from ..fastreid.engine import DefaultPredictor
+from .embed import default_onnx_path
+
+INPUT_NAME = "images"
+OUTPUT_NAME = "features"
+
+
+class ExportModel(nn.Module):
+    """
+    The whole FastReID Embedding in one graph: uint8 BGR crops (N, H, W, 3) at the test size
+    -> L2-normalised (N, dim) features, so ONNX Runtime takes the resized crops as they are.
+    """
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, images):
+        # BGR->RGB, HWC->CHW and uint8->float32, the pixel normalisation is done by the model
+        images = images.permute(0, 3, 1, 2).flip(1).float()
+        features = self.model(images)
+        return F.normalize(features)
+
+
+def export_onnx(cfg_dict, onnx_path: str = None, opset: int = 18) -> str:
+    """
+    Export a FastReID model (Baseline backbone + EmbeddingHead, eval path) to ONNX with a
+    dynamic batch axis. BN is fused into the convs before the export, the pixel normalisation
+    stays in the graph.
+
+    Args:
+        cfg_dict: dict hoặc string (đường dẫn tới file YAML của FastReID)
+        onnx_path: output path, `default_onnx_path` when None
+    Returns:
+        the path of the ONNX model
+    """
+    cfg = load_cfg(cfg_dict)
+    onnx_path = onnx_path or default_onnx_path(cfg)
+    cfg.defrost()
+    cfg.MODEL.DEVICE = "cpu"
+    # the folded stem conv pads with the pixel mean, simpler kept as Sub/Div in the graph
+    cfg.TEST.FOLD_PIXEL_NORM = False
+    predictor = DefaultPredictor(cfg)
+    model = ExportModel(predictor.model).eval()
+
+    h, w = cfg.INPUT.SIZE_TEST
+    dummy = torch.zeros((2, h, w, 3), dtype=torch.uint8)
+    print(f"[Embedding] Exporting {cfg.MODEL.WEIGHTS} to {onnx_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (dummy,), onnx_path,
+            input_names=[INPUT_NAME],
+            output_names=[OUTPUT_NAME],
+            dynamic_axes={INPUT_NAME: {0: "batch"}, OUTPUT_NAME: {0: "batch"}},
+            opset_version=opset,
+            # a single file, OSNet-sized weights are far below the 2GB protobuf limit
+            external_data=False,
+        )
+    return onnx_path
+
+
+if __name__ == '__main__':
+    # @ ./src$ python -m modules.embedding.fastreid_onnx.export ../cfg/osnet-ain_x1.0-ibn_512_256x192_ccdmmps.yaml [out.onnx]
+    import sys
+    import time
+
+    import numpy as np
+
+    from ..fastreid.embed import Embedding as TorchEmbedding
+    from .embed import Embedding
+
+    cfg_path = sys.argv[1]
+    onnx_path = export_onnx(cfg_path, sys.argv[2] if len(sys.argv) > 2 else None)
+
+    # same features as the PyTorch embedder
+    torch_embed = TorchEmbedding(cfg_path)
+    onnx_embed = Embedding({"fast_reid": cfg_path, "model_path": onnx_path})
+    h, w = torch_embed.size_test
+    crops = list(np.random.default_rng(0).integers(0, 256, (16, h, w, 3), dtype=np.uint8))
+    for name, embed in (("torch", torch_embed), ("onnxruntime", onnx_embed)):
+        embed.extract_feature(crops)
+        st_time = time.time()
+        features = embed.extract_feature(crops)
+        print(f"{name}: {(time.time() - st_time) * 1000:.1f} ms / {len(crops)} crops")
+    diff = np.abs(torch_embed.extract_feature(crops) - features).max()
+    print(f"max abs diff {diff:.3g}")
@@ -0,0 +1,28 @@
+import numpy as np
+import onnxruntime
+
+
+class Network:
+    """
+    ONNX Runtime CPU session of an exported FastReID model (see export.py): uint8 BGR crops
+    (N, H, W, 3) in, L2-normalised (N, dim) features out.
+    """
+    def __init__(self, model_path, num_threads=0, allow_spinning=True):
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # a single chain of convs: parallelism within the ops only
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        if not allow_spinning:
+            # idle threads sleep instead of busy waiting, leaves the cores to the other pipeline stages
+            options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        # Get model info
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_height, self.input_width = model_input.shape[1:3]
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def inference(self, input_tensor: np.ndarray) -> np.ndarray:
+        return self.session.run(self.output_names, {self.input_name: input_tensor})[0]
@@ -0,0 +1,176 @@
+import glob
+import os
+import tempfile
+from typing import Dict, List
+
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+# static only: dynamic quantization of the MatMul/Gemm finds none in the OSNet graphs, and of
+# the Conv runs ConvInteger kernels several times slower than the FP32 convs
+QUANTIZATION_MODES = ("static",)
+CALIBRATION_METHODS = {
+    "minmax": CalibrationMethod.MinMax,
+    "entropy": CalibrationMethod.Entropy,
+    "percentile": CalibrationMethod.Percentile,
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MAX_CALIB_CROPS = 512
+
+
+def int8_onnx_path(onnx_path: str, mode: str) -> str:
+    """<fp32 model without extension>.<mode>-int8.onnx"""
+    return f"{os.path.splitext(onnx_path)[0]}.{mode}-int8.onnx"
+
+
+def list_crops(crops_dir: str) -> List[str]:
+    """Image files under `crops_dir`, recursively and sorted."""
+    paths = glob.glob(os.path.join(crops_dir, "**", "*"), recursive=True)
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_crops(paths: List[str], size_test, interpolation) -> np.ndarray:
+    """(N, H, W, 3) uint8 BGR crops at the test size, the input of the exported model."""
+    h, w = size_test
+    crops = np.empty((len(paths), h, w, 3), dtype=np.uint8)
+    for crop, path in zip(crops, paths):
+        img_bgr = cv2.imread(path)
+        if img_bgr is None:
+            raise IOError(f"Cannot read {path}")
+        cv2.resize(img_bgr, (w, h), dst=crop, interpolation=interpolation)
+    return crops
+
+
+class CropsDataReader(CalibrationDataReader):
+    """Calibration batches of saved person crops, preprocessed like the embedder."""
+    def __init__(self, input_name: str, crops: np.ndarray, batch_size: int = 16):
+        self.input_name = input_name
+        self.batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+        self.batch_id = 0
+
+    def get_next(self):
+        if self.batch_id >= len(self.batches):
+            return None
+        batch = self.batches[self.batch_id]
+        self.batch_id += 1
+        return {self.input_name: batch}
+
+    def rewind(self):
+        self.batch_id = 0
+
+
+def quantize_model(onnx_path: str, mode: str, output_path: str = None, calib_crops: np.ndarray = None,
+                   calibrate_method: str = "minmax", per_channel: bool = True) -> str:
+    """
+    Post-training INT8 quantization of an exported FastReID model (see export.py).
+
+    Args:
+        mode: "static": weights and activations of every conv/linear in int8 (QDQ), the
+            activation ranges calibrated on `calib_crops`.
+        output_path: `int8_onnx_path` when None
+        calib_crops: (N, H, W, 3) uint8 BGR crops, see `load_crops`
+    Returns:
+        the path of the quantized model
+    """
+    assert mode in QUANTIZATION_MODES, f"Unknown quantization {mode}, expected one of {QUANTIZATION_MODES}"
+    output_path = output_path or int8_onnx_path(onnx_path, mode)
+    print(f"[Quantization] {mode} INT8 quantization of {onnx_path} to {output_path}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # shape inference and graph optimisation (BN folding etc.) before the quantization
+        preprocessed_path = os.path.join(tmp_dir, "preprocessed.onnx")
+        # the symbolic shape inference fails on the Expand of F.normalize, ONNX's own is enough here
+        quant_pre_process(onnx_path, preprocessed_path, skip_symbolic_shape=True)
+
+        assert calib_crops is not None and len(calib_crops), "static quantization needs calibration crops"
+        input_name = onnx.load(preprocessed_path, load_external_data=False).graph.input[0].name
+        quantize_static(
+            preprocessed_path, output_path,
+            CropsDataReader(input_name, calib_crops),
+            quant_format=QuantFormat.QDQ,
+            per_channel=per_channel,
+            # u8 activations x s8 weights: the VNNI / AVX2 int8 kernels of the CPU provider
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CALIBRATION_METHODS[calibrate_method],
+            calibration_providers=["CPUExecutionProvider"],
+        )
+    return output_path
+
+
+def check_accuracy(fp32_features: np.ndarray, int8_features: np.ndarray, labels: List = None) -> Dict:
+    """
+    Agreement of the INT8 model with the FP32 one on held-out crops.
+
+    Returns:
+        cosine_mean / cosine_min: cosine similarity between the FP32 and INT8 feature of each crop
+        rank1_agreement: fraction of crops with the same nearest neighbour (itself excluded)
+        rank1_fp32 / rank1_int8 / rank1_drift: rank-1 accuracy when `labels` (person ids) are given
+    """
+    cosine = (fp32_features * int8_features).sum(axis=1)
+    results = dict(num_crops=len(cosine), cosine_mean=float(cosine.mean()), cosine_min=float(cosine.min()))
+
+    nearest = []
+    for features in (fp32_features, int8_features):
+        similarity = features @ features.T
+        np.fill_diagonal(similarity, -np.inf)
+        nearest.append(similarity.argmax(axis=1))
+    results["rank1_agreement"] = float((nearest[0] == nearest[1]).mean())
+
+    if labels is not None and len(set(labels)) > 1:
+        labels = np.asarray(labels)
+        results["rank1_fp32"] = float((labels[nearest[0]] == labels).mean())
+        results["rank1_int8"] = float((labels[nearest[1]] == labels).mean())
+        results["rank1_drift"] = results["rank1_int8"] - results["rank1_fp32"]
+    return results
+
+
+if __name__ == '__main__':
+    # @ ./src$ python -m modules.embedding.fastreid_onnx.quantize --config <fastreid yaml> --mode static \
+    #     --calib-dir <crops> --eval-dir <held-out crops, one sub folder per person>
+    import argparse
+    import time
+
+    from .embed import Embedding
+
+    parser = argparse.ArgumentParser(description="INT8 quantization of the FastReID ONNX embedder")
+    parser.add_argument("--config", required=True, help="FastReID config (YAML)")
+    parser.add_argument("--model", default=None, help="FP32 ONNX model, exported from the config when missing")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default="static")
+    parser.add_argument("--calib-dir", required=True, help="saved person crops for the static calibration")
+    parser.add_argument("--max-calib", type=int, default=MAX_CALIB_CROPS, help="max number of calibration crops")
+    parser.add_argument("--calib-method", choices=CALIBRATION_METHODS.keys(), default="minmax")
+    parser.add_argument("--eval-dir", default=None, help="held-out crops for the accuracy check")
+    parser.add_argument("--output", default=None, help="INT8 ONNX model, default <model>.<mode>-int8.onnx")
+    args = parser.parse_args()
+
+    fp32_embed = Embedding({"fast_reid": args.config, "model_path": args.model})
+    onnx_path = fp32_embed.model_path
+    calib_paths = list_crops(args.calib_dir)[:args.max_calib]
+    print(f"[Quantization] Calibrating on {len(calib_paths)} crops from {args.calib_dir}")
+    calib_crops = load_crops(calib_paths, fp32_embed.size_test, fp32_embed.interpolation)
+    output_path = quantize_model(onnx_path, args.mode, args.output, calib_crops, args.calib_method)
+
+    if args.eval_dir:
+        int8_embed = Embedding({"fast_reid": args.config, "model_path": output_path})
+        eval_paths = list_crops(args.eval_dir)
+        crops = list(load_crops(eval_paths, fp32_embed.size_test, fp32_embed.interpolation))
+        # the parent folder is the person id
+        labels = [os.path.basename(os.path.dirname(path)) for path in eval_paths]
+        features = []
+        for name, embed in (("fp32", fp32_embed), ("int8", int8_embed)):
+            embed.extract_feature(crops[:16])
+            st_time = time.time()
+            features.append(np.concatenate([embed.extract_feature(crops[i:i + 16]) for i in range(0, len(crops), 16)]))
+            print(f"[Quantization] {name}: {(time.time() - st_time) * 1000 / len(crops):.2f} ms / crop")
+        for key, value in check_accuracy(*features, labels).items():
+            print(f"[Quantization] {key}: {value:.4f}" if isinstance(value, float) else f"[Quantization] {key}: {value}")
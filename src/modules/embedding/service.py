@@ -0,0 +1,128 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List
+
+import numpy as np
+
+from .base import IEmbedding
+
+# put on the request queue to stop the worker
+_STOP = None
+
+
+class EmbeddingService(IEmbedding):
+    """Micro-batching wrapper around an Embedding (fastreid or CLIP ONNX).
+
+    `submit` queues crops and returns a Future of their (N, dim) embeddings. A worker thread
+    merges the queued requests into batches of up to `max_batch` crops, waiting at most
+    `max_wait_ms` after the first one, so callers keep working while the model runs.
+    `extract_feature` keeps the synchronous Embedding API.
+    """
+    def __init__(self, embed: IEmbedding, max_batch: int = 64, max_wait_ms: float = 2):
+        self.embed = embed
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.
+        self.requests = queue.Queue()
+        self.batch_sizes = collections.Counter()
+        self.num_queued_crops = 0
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+
+    @property
+    def cfg(self):
+        return self.embed.cfg
+
+    @property
+    def interpolation(self):
+        return self.embed.interpolation
+
+    def _preprocess(self, imgs_bgr):
+        if not isinstance(imgs_bgr, list):
+            imgs_bgr = [imgs_bgr]
+        return imgs_bgr
+
+    def submit(self, imgs_bgr) -> Future:
+        imgs_bgr = self._preprocess(imgs_bgr)
+        future = Future()
+        if not imgs_bgr:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+            return future
+        with self.lock:
+            self.num_queued_crops += len(imgs_bgr)
+        self.requests.put((imgs_bgr, future))
+        return future
+
+    def extract_feature(self, imgs_bgr):
+        return self.submit(imgs_bgr).result()
+
+    def _worker(self):
+        is_stopped = False
+        while not is_stopped:
+            # first request blocks, then gather the others until max_batch crops or max_wait
+            request = self.requests.get()
+            if request is _STOP:
+                break
+            requests = [request]
+            batch_size = len(request[0])
+            deadline = time.monotonic() + self.max_wait
+            while batch_size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    is_stopped = True
+                    break
+                requests.append(request)
+                batch_size += len(request[0])
+            with self.lock:
+                self.num_queued_crops -= batch_size
+            self._run_batch(requests)
+
+    def _run_batch(self, requests: List):
+        crops = [crop for imgs_bgr, _ in requests for crop in imgs_bgr]
+        try:
+            # a single request larger than max_batch is split into max_batch chunks
+            features = []
+            for start in range(0, len(crops), self.max_batch):
+                chunk = crops[start:start + self.max_batch]
+                self.batch_sizes[len(chunk)] += 1
+                features.append(np.asarray(self.embed.extract_feature(chunk)))
+            features = np.concatenate(features, axis=0)
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for imgs_bgr, future in requests:
+            future.set_result(features[start:start + len(imgs_bgr)])
+            start += len(imgs_bgr)
+
+    def stats(self) -> Dict:
+        """Queue depth (requests and crops waiting for a batch) and the histogram of batch sizes."""
+        return dict(
+            queue_depth=self.requests.qsize(),
+            queued_crops=self.num_queued_crops,
+            batch_sizes=dict(sorted(self.batch_sizes.items())),
+        )
+
+    def report(self):
+        num_batches = sum(self.batch_sizes.values())
+        if not num_batches:
+            return
+        num_crops = sum(size * count for size, count in self.batch_sizes.items())
+        print(f"[EmbeddingService] {num_crops} crops in {num_batches} batches ({num_crops / num_batches:.1f} crops/batch)")
+        print(f"[EmbeddingService] Batch sizes: {dict(sorted(self.batch_sizes.items()))}")
+
+    def close(self):
+        """Embed the queued requests and stop the worker."""
+        self.requests.put(_STOP)
+        self.worker.join()
@@ -2,7 +2,8 @@ from typing import Dict
 from collections import defaultdict
 
 from modules.templates.templates import sTrackInfo, TrackSession, TimeSession, GalleryElement
-from modules.gallery.utils import choose_index
+from modules.gallery.storage import EmbeddingStorage
+from modules.gallery.session_index import SessionIndex
 
 class Gallery:
     def __init__(self, gallery_config: Dict):
@@ -12,24 +13,15 @@ class Gallery:
         self.delayT_rmExitedCustomer = gallery_config.get('delayT_rmExitedCustomer', 5)
         self.max_spt_dis = gallery_config.get('max_spt_dis', 400)
         self.customer_gallery: Dict[int, GalleryElement] = {}
+        # embeddings of all customers, GalleryElement.embeddings are views into it
+        self.storage = EmbeddingStorage(self.max_no_embds)
+        # time sessions of all customers for the overlap filter of read_all
+        self.session_index = SessionIndex()
         self.num_person = 0
     
     def read_all(self, track_info: sTrackInfo):
-        vge = []
-        overlap_time_ids = []
-
-        for c_id, ge in self.customer_gallery.items():
-            if any(
-                min(track_info.time_session.end_time, ses.time_session.end_time) >=
-                max(track_info.time_session.start_time, ses.time_session.start_time)
-                for ses in ge.sessions
-            ):
-                overlap_time_ids.append(c_id)
-
-        for c_id, ge in self.customer_gallery.items():
-            if c_id in overlap_time_ids:
-                continue
-            vge.append(ge)
+        overlap_time_ids = self.session_index.overlap_ids(track_info.time_session)
+        vge = [ge for c_id, ge in self.customer_gallery.items() if c_id not in overlap_time_ids]
 
         return vge
 
@@ -38,8 +30,11 @@ class Gallery:
         customer_id = self.num_person
         track_session = TrackSession(track_id=track_info.track_id, time_session=track_info.time_session)
         time_session = TimeSession(start_time=track_info.time_session.start_time, end_time=track_info.time_session.end_time)
-        ge = GalleryElement(customer_id=customer_id, sessions=[track_session], embeddings=track_info.embeddings, time_session=time_session)
+        moved = self.storage.append(customer_id, track_info.embeddings)
+        ge = GalleryElement(customer_id=customer_id, sessions=[track_session], embeddings=self.storage.get(customer_id), time_session=time_session)
         self.customer_gallery[customer_id] = ge
+        self.session_index.add(customer_id, track_session.time_session)
+        self._sync_embeddings(None if moved else [customer_id])
         print(f"Create track {track_info.track_id} with cid: {customer_id}.")
         # save reid
         
@@ -82,38 +77,41 @@ class Gallery:
         if customer_id in self.customer_gallery.keys():
             track_session = TrackSession(track_info.track_id, track_info.time_session)
             
-            for q_embeddings in track_info.embeddings:
-                g_embeddings = self.customer_gallery[customer_id].embeddings
-                
-                # Đảm bảo embeddings là list các vector numpy
-                if not isinstance(g_embeddings, list):
-                    g_embeddings = [g_embeddings]
-                if not isinstance(q_embeddings, list):
-                    q_embeddings = [q_embeddings]
-                
-                if len(g_embeddings) > 0:
-                    self.customer_gallery[customer_id].update_time += 1
-                    indices = choose_index(
-                        self.customer_gallery[customer_id].update_time,
-                        len(g_embeddings),
-                        len(q_embeddings),
-                        self.max_no_embds
-                    )
-                    
-                    # Nối 2 list vector
-                    all_embeds = g_embeddings + q_embeddings
-                    # Giữ lại max_no_embds vector cuối
-                    self.customer_gallery[customer_id].embeddings = all_embeds[-self.max_no_embds:]
+            num_q_embeddings = len(track_info.embeddings)
+            if num_q_embeddings > 0:
+                # one update per query vector, restarting from 1 on an empty gallery element
+                if len(self.customer_gallery[customer_id].embeddings) > 0:
+                    self.customer_gallery[customer_id].update_time += num_q_embeddings
                 else:
-                    self.customer_gallery[customer_id].update_time = 1
-                    self.customer_gallery[customer_id].embeddings = q_embeddings
+                    self.customer_gallery[customer_id].update_time = num_q_embeddings
+                # keep the latest max_no_embds vectors in place in the storage block
+                moved = self.storage.append(customer_id, track_info.embeddings)
+                self._sync_embeddings(None if moved else [customer_id])
             
             self.customer_gallery[customer_id].sessions.append(track_session)
             self.customer_gallery[customer_id].sessions.sort(key=lambda x: x.time_session.end_time)
+            self.session_index.add(customer_id, track_session.time_session)
             
             if track_info.time_session.start_time < self.customer_gallery[customer_id].time_session.start_time:
                 self.customer_gallery[customer_id].time_session.start_time = track_info.time_session.start_time
             if track_info.time_session.end_time > self.customer_gallery[customer_id].time_session.end_time:
                 self.customer_gallery[customer_id].time_session.end_time = track_info.time_session.end_time
 
-    
\ No newline at end of file
+    def remove(self, customer_id):
+        self.customer_gallery.pop(customer_id)
+        self.storage.evict(customer_id)
+        self.session_index.remove(customer_id)
+        if self.storage.maybe_compact():
+            self._sync_embeddings()
+
+    def clear(self):
+        self.customer_gallery.clear()
+        self.storage = EmbeddingStorage(self.max_no_embds)
+        self.session_index.clear()
+
+    def _sync_embeddings(self, customer_ids=None):
+        """Re-read the storage views of customer_ids, of every customer if None."""
+        if customer_ids is None:
+            customer_ids = list(self.customer_gallery.keys())
+        for customer_id in customer_ids:
+            self.customer_gallery[customer_id].embeddings = self.storage.get(customer_id)
@@ -0,0 +1,42 @@
+from bisect import bisect_left, bisect_right
+from typing import List, Set, Tuple
+
+from modules.templates.templates import TimeSession
+
+
+class SessionIndex:
+    """Sorted-endpoint index of the track sessions of all gallery customers.
+
+    Sessions are kept sorted by end time and only that side is bisected: a query skips the
+    sessions ending before its start in O(log n), then scans every session ending after it
+    to check the start times. This is not an interval tree, the scan is linear in the number
+    of sessions ending after the query start, e.g. all of them for a query from early in the
+    day. Queries come from tracks that just ended, for which that tail stays short.
+    `add` inserts into sorted lists (at the end for sessions ending in time order) and
+    `remove` rebuilds them, both O(n).
+    """
+    def __init__(self):
+        self.end_times = []
+        self.entries: List[Tuple[object, int]] = []  # (start_time, customer_id), aligned with end_times
+
+    def __len__(self):
+        return len(self.end_times)
+
+    def add(self, customer_id: int, time_session: TimeSession):
+        idx = bisect_right(self.end_times, time_session.end_time)
+        self.end_times.insert(idx, time_session.end_time)
+        self.entries.insert(idx, (time_session.start_time, customer_id))
+
+    def remove(self, customer_id: int):
+        keep = [i for i, (_, cid) in enumerate(self.entries) if cid != customer_id]
+        self.end_times = [self.end_times[i] for i in keep]
+        self.entries = [self.entries[i] for i in keep]
+
+    def clear(self):
+        self.end_times = []
+        self.entries = []
+
+    def overlap_ids(self, time_session: TimeSession) -> Set[int]:
+        """Ids of the customers with a session overlapping time_session, scans the sessions ending after its start."""
+        idx = bisect_left(self.end_times, time_session.start_time)
+        return {cid for start_time, cid in self.entries[idx:] if start_time <= time_session.end_time}
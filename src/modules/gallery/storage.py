@@ -0,0 +1,131 @@
+from typing import Dict
+
+import numpy as np
+
+
+class EmbeddingStorage:
+    """Gallery embeddings kept in one preallocated float32 matrix.
+
+    Every customer owns a block of `max_no_embds` consecutive rows, block `i` covers rows
+    [i * max_no_embds, (i + 1) * max_no_embds) and only its first `counts[i]` rows are in use.
+    Per-customer embeddings are returned as views of the matrix, so they must be re-read
+    after an operation that moves blocks (`append` growing the matrix, `compact`).
+    """
+    def __init__(self, max_no_embds: int, init_num_customers: int = 64):
+        self.max_no_embds = max_no_embds
+        self.dim = None
+        self.data = np.zeros((0, 0), dtype=np.float32)
+        self.block_owners = np.full(init_num_customers, -1, dtype=np.int64)
+        self.counts = np.zeros(init_num_customers, dtype=np.int64)
+        self.customer_blocks: Dict[int, int] = {}
+        self.num_blocks = 0
+
+    def __contains__(self, customer_id: int):
+        return customer_id in self.customer_blocks
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the rows of all allocated blocks, used or not."""
+        return self.data[:self.num_blocks * self.max_no_embds]
+
+    @property
+    def row_owners(self) -> np.ndarray:
+        """Customer id of every row of `matrix`, -1 for unused rows."""
+        block_ids = np.repeat(np.arange(self.num_blocks), self.max_no_embds)
+        used = np.tile(np.arange(self.max_no_embds), self.num_blocks) < self.counts[block_ids]
+        return np.where(used, self.block_owners[block_ids], -1)
+
+    def get(self, customer_id: int) -> np.ndarray:
+        block = self.customer_blocks[customer_id]
+        start = block * self.max_no_embds
+        return self.data[start:start + self.counts[block]]
+
+    def append(self, customer_id: int, embeddings) -> bool:
+        """Append embeddings to the block of customer_id, keeping its latest max_no_embds rows.
+
+        Returns True when the matrix was reallocated and previously returned views are stale.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.size == 0:
+            if customer_id not in self.customer_blocks:
+                return self._add_block(customer_id)
+            return False
+        if self.dim is None:
+            self.dim = embeddings.shape[-1]
+        embeddings = embeddings.reshape(-1, self.dim)[-self.max_no_embds:]
+
+        moved = self._ensure_capacity()
+        if customer_id not in self.customer_blocks:
+            moved = self._add_block(customer_id) or moved
+        block = self.customer_blocks[customer_id]
+        rows = self.data[block * self.max_no_embds:(block + 1) * self.max_no_embds]
+
+        count = self.counts[block]
+        num_keep = min(count, self.max_no_embds - len(embeddings))
+        # shift the kept rows to the front of the block in place, then write the new ones
+        rows[:num_keep] = rows[count - num_keep:count]
+        rows[num_keep:num_keep + len(embeddings)] = embeddings
+        self.counts[block] = num_keep + len(embeddings)
+        return moved
+
+    def evict(self, customer_id: int):
+        block = self.customer_blocks.pop(customer_id)
+        self.block_owners[block] = -1
+        self.counts[block] = 0
+
+    def compact(self) -> bool:
+        """Move used blocks over the evicted ones so the used blocks are contiguous.
+
+        Returns True when blocks were moved and previously returned views are stale.
+        """
+        used_blocks = np.flatnonzero(self.block_owners[:self.num_blocks] >= 0)
+        if len(used_blocks) == self.num_blocks:
+            return False
+
+        for new_block, block in enumerate(used_blocks):
+            if new_block != block:
+                self.data[new_block * self.max_no_embds:(new_block + 1) * self.max_no_embds] = \
+                    self.data[block * self.max_no_embds:(block + 1) * self.max_no_embds]
+        num_blocks = len(used_blocks)
+        self.block_owners[:num_blocks] = self.block_owners[used_blocks]
+        self.counts[:num_blocks] = self.counts[used_blocks]
+        self.block_owners[num_blocks:] = -1
+        self.counts[num_blocks:] = 0
+        self.num_blocks = num_blocks
+        self.customer_blocks = {int(cid): block for block, cid in enumerate(self.block_owners[:num_blocks])}
+        return True
+
+    def maybe_compact(self) -> bool:
+        """`compact` once the evicted blocks outnumber the used ones.
+
+        Returns True when blocks were moved and previously returned views are stale.
+        """
+        if self.num_blocks > 2 * len(self.customer_blocks):
+            return self.compact()
+        return False
+
+    def _add_block(self, customer_id: int) -> bool:
+        if self.num_blocks == len(self.block_owners):
+            # double the block capacity
+            self.block_owners = np.concatenate([self.block_owners, np.full(len(self.block_owners), -1, dtype=np.int64)])
+            self.counts = np.concatenate([self.counts, np.zeros(len(self.counts), dtype=np.int64)])
+        moved = self._ensure_capacity()
+
+        block = self.num_blocks
+        self.block_owners[block] = customer_id
+        self.counts[block] = 0
+        self.customer_blocks[customer_id] = block
+        self.num_blocks += 1
+        return moved
+
+    def _ensure_capacity(self) -> bool:
+        """Allocate the matrix rows of every block once the embedding dim is known."""
+        num_rows = len(self.block_owners) * self.max_no_embds
+        if self.dim is None or self.data.shape == (num_rows, self.dim):
+            return False
+        data = np.zeros((num_rows, self.dim), dtype=np.float32)
+        moved = len(self.data) > 0
+        if moved:
+            data[:len(self.data)] = self.data
+        self.data = data
+        return moved
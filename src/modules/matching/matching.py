@@ -3,6 +3,7 @@ from scipy.spatial.distance import cdist
 import numpy as np
 
 from modules.templates.templates import MatchingResult, TrackInfo, GalleryElement
+from modules.gallery.storage import EmbeddingStorage
 
 METRIC = 'cosine'
 
@@ -11,7 +12,75 @@ class Matching:
         self.distance_threshold = matching_config['threshold']
     
     def match_with_all_ids(self, query_track: TrackInfo, l_ge: List[GalleryElement]) -> List[MatchingResult]:
-        match_results = [self._match_with_one_id(query_track, ge) for ge in l_ge]
+        """
+        Match the query track with every gallery element at once.
+        All gallery embeddings are stacked into one float32 matrix with an owner index, the
+        cosine distances come from a single matmul (embeddings are L2-normalised by
+        Embedding.extract_feature) and are reduced per customer with segment operations.
+        """
+        match_results = [MatchingResult(match_id=ge.customer_id, match_frequency=0, match_distance=0.0) for ge in l_ge]
+        
+        q = to_2d_array(query_track.embeddings, dtype=np.float32)
+        l_g = [to_2d_array(ge.embeddings, dtype=np.float32) for ge in l_ge]
+        owners = [i for i, g in enumerate(l_g) if g.size > 0]
+        if q.size == 0 or not owners:
+            match_results.sort(key=lambda x: (x.match_frequency, -x.match_distance), reverse=True)
+            return match_results
+        
+        g = np.concatenate([l_g[i] for i in owners], axis=0)
+        if q.shape[1] != g.shape[1]:
+            raise ValueError(f"Embedding dimension mismatch: q has dim {q.shape[1]}, g has dim {g.shape[1]}")
+        starts = np.cumsum([0] + [len(l_g[i]) for i in owners[:-1]])
+        
+        dist_mtx = 1.0 - q @ g.T  # shape (num_q, num_g)
+        match_mask = dist_mtx < self.distance_threshold
+        
+        # segment reductions over the gallery columns of each customer
+        match_frequencies = np.add.reduceat(match_mask.sum(axis=0), starts)
+        match_dist_sums = np.add.reduceat(np.where(match_mask, dist_mtx, 0.0).sum(axis=0), starts)
+        min_dists = np.minimum.reduceat(dist_mtx.min(axis=0), starts)
+        
+        for i, freq, dist_sum, min_dist in zip(owners, match_frequencies, match_dist_sums, min_dists):
+            # average the below-threshold distances, otherwise use the closest attempt
+            match_results[i].match_frequency = int(freq)
+            match_results[i].match_distance = float(dist_sum / freq) if freq > 0 else float(min_dist)
+        
+        match_results.sort(key=lambda x: (x.match_frequency, -x.match_distance), reverse=True)
+        
+        return match_results
+    
+    def match_with_storage(self, query_track: TrackInfo, storage: EmbeddingStorage, customer_ids: List[int]) -> List[MatchingResult]:
+        """
+        Same as match_with_all_ids, but reads the gallery embeddings zero-copy from the
+        contiguous EmbeddingStorage matrix and reduces over the block of every customer.
+        """
+        match_results = [MatchingResult(match_id=cid, match_frequency=0, match_distance=0.0) for cid in customer_ids]
+        
+        q = to_2d_array(query_track.embeddings, dtype=np.float32)
+        if q.size == 0 or storage.dim is None or not customer_ids:
+            match_results.sort(key=lambda x: (x.match_frequency, -x.match_distance), reverse=True)
+            return match_results
+        if q.shape[1] != storage.dim:
+            raise ValueError(f"Embedding dimension mismatch: q has dim {q.shape[1]}, g has dim {storage.dim}")
+        
+        blocks = np.array([storage.customer_blocks[cid] for cid in customer_ids])
+        counts = storage.counts[blocks]
+        used = np.arange(storage.max_no_embds)[None, :] < counts[:, None]  # shape (num_ids, max_no_embds)
+        
+        dist_mtx = 1.0 - q @ storage.matrix.T  # shape (num_q, num_blocks * max_no_embds)
+        dist_mtx = dist_mtx.reshape(len(q), storage.num_blocks, storage.max_no_embds)[:, blocks]
+        match_mask = (dist_mtx < self.distance_threshold) & used
+        
+        match_frequencies = match_mask.sum(axis=(0, 2))
+        match_dist_sums = np.where(match_mask, dist_mtx, 0.0).sum(axis=(0, 2))
+        min_dists = np.where(used, dist_mtx, np.inf).min(axis=(0, 2))
+        
+        for match_res, count, freq, dist_sum, min_dist in zip(match_results, counts, match_frequencies, match_dist_sums, min_dists):
+            if count == 0:
+                continue
+            match_res.match_frequency = int(freq)
+            match_res.match_distance = float(dist_sum / freq) if freq > 0 else float(min_dist)
+        
         match_results.sort(key=lambda x: (x.match_frequency, -x.match_distance), reverse=True)
         
         return match_results
@@ -47,40 +116,12 @@ class Matching:
         Convert inputs to 2-D numpy arrays safely, then compute distance matrix.
         Returns MatchingResult with match_frequency and match_distance.
         """
-        def _to_2d_array(x):
-            """Convert x (list/ndarray/nested) to a 2-D numpy array with shape (N, D)."""
-            if x is None:
-                return np.zeros((0, 0), dtype=float)
-
-            # Quick path: already numpy array
-            arr = np.asarray(x)
-            # squeeze trivial extra dims (e.g. shape (1, D) or (1,1,D))
-            arr = np.squeeze(arr)
-
-            if arr.ndim == 0:
-                # single scalar -> treat as 1x1
-                return arr.reshape(1, 1).astype(float)
-            if arr.ndim == 1:
-                # single vector -> (1, D)
-                return arr.reshape(1, -1).astype(float)
-            if arr.ndim == 2:
-                return arr.astype(float)
-
-            # If arr has >2 dims (rare), try to stack elements (handles list of vectors)
-            try:
-                stacked = np.vstack([np.asarray(e).squeeze() for e in x])
-                if stacked.ndim == 1:
-                    return stacked.reshape(1, -1).astype(float)
-                return stacked.astype(float)
-            except Exception as e:
-                raise ValueError(f"Cannot convert embeddings to 2D array: {e}")
-
         match_results = MatchingResult(match_id=-1, match_frequency=0, match_distance=0.0)
 
         # convert inputs
         try:
-            q = _to_2d_array(q_embedds)
-            g = _to_2d_array(ge_embedds)
+            q = to_2d_array(q_embedds)
+            g = to_2d_array(ge_embedds)
         except ValueError as e:
             # optional: log the error for debugging
             print("convert embeddings error:", e)
@@ -116,3 +157,32 @@ class Matching:
         match_results.match_distance = mean_dist
 
         return match_results
+
+
+def to_2d_array(x, dtype=float):
+    """Convert x (list/ndarray/nested) to a 2-D numpy array with shape (N, D)."""
+    if x is None:
+        return np.zeros((0, 0), dtype=dtype)
+
+    # Quick path: already numpy array
+    arr = np.asarray(x)
+    # squeeze trivial extra dims (e.g. shape (1, D) or (1,1,D))
+    arr = np.squeeze(arr)
+
+    if arr.ndim == 0:
+        # single scalar -> treat as 1x1
+        return arr.reshape(1, 1).astype(dtype)
+    if arr.ndim == 1:
+        # single vector -> (1, D)
+        return arr.reshape(1, -1).astype(dtype)
+    if arr.ndim == 2:
+        return arr.astype(dtype)
+
+    # If arr has >2 dims (rare), try to stack elements (handles list of vectors)
+    try:
+        stacked = np.vstack([np.asarray(e).squeeze() for e in x])
+        if stacked.ndim == 1:
+            return stacked.reshape(1, -1).astype(dtype)
+        return stacked.astype(dtype)
+    except Exception as e:
+        raise ValueError(f"Cannot convert embeddings to 2D array: {e}")
@@ -0,0 +1,213 @@
+import copy
+import functools
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+from typing import Dict, List
+
+import numpy as np
+from yacs.config import CfgNode
+
+from modules.embedding.base import IEmbedding
+from modules.embedding.fastreid.embed import resize_crops
+from modules.embedding.service import EmbeddingService
+
+# put on the request queue to stop the embedding server
+STOP = None
+
+
+class CameraSlab:
+    """Crops sent by one camera and their embeddings, in shared memory owned by the embedding server."""
+    def __init__(self, max_crops: int, crop_size, dim: int, names=None):
+        h, w = crop_size
+        crops_nbytes = max_crops * h * w * 3
+        feats_nbytes = max_crops * dim * np.dtype(np.float32).itemsize
+        self.is_owner = names is None
+        if self.is_owner:
+            self.crops_shm = shared_memory.SharedMemory(create=True, size=crops_nbytes)
+            self.feats_shm = shared_memory.SharedMemory(create=True, size=feats_nbytes)
+        else:
+            self.crops_shm = shared_memory.SharedMemory(name=names[0])
+            self.feats_shm = shared_memory.SharedMemory(name=names[1])
+        self.crops = np.ndarray((max_crops, h, w, 3), dtype=np.uint8, buffer=self.crops_shm.buf)
+        self.feats = np.ndarray((max_crops, dim), dtype=np.float32, buffer=self.feats_shm.buf)
+
+    @property
+    def names(self):
+        return self.crops_shm.name, self.feats_shm.name
+
+    def close(self):
+        del self.crops, self.feats
+        for shm in (self.crops_shm, self.feats_shm):
+            shm.close()
+            if self.is_owner:
+                shm.unlink()
+
+
+class RemoteEmbedding(IEmbedding):
+    """Embedding of a camera worker computed by the shared embedding server.
+
+    Crops are written to the camera slab and only (camera_id, num_crops) goes through the
+    request queue, the server writes the embeddings back to the slab.
+    """
+    def __init__(self, camera_id: int, server_info: Dict, request_queue, response_queue, timeout: float = 60.):
+        self.camera_id = camera_id
+        self.crop_size = tuple(server_info["crop_size"])
+        self.interpolation = server_info["interpolation"]
+        self.cfg = CfgNode({"INPUT": CfgNode({"SIZE_TEST": list(self.crop_size)})})
+        self.slab = CameraSlab(server_info["max_crops"], self.crop_size, server_info["dim"], server_info["slab_names"][camera_id])
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.timeout = timeout
+
+    def _preprocess(self, imgs_bgr):
+        if not isinstance(imgs_bgr, list):
+            imgs_bgr = [imgs_bgr]
+        return imgs_bgr
+
+    def extract_feature(self, imgs_bgr):
+        imgs_bgr = self._preprocess(imgs_bgr)
+        max_crops = len(self.slab.crops)
+        features = []
+        for start in range(0, len(imgs_bgr), max_crops):
+            chunk = imgs_bgr[start:start + max_crops]
+            resize_crops(chunk, self.slab.crops, self.interpolation)
+            self.request_queue.put((self.camera_id, len(chunk)))
+            try:
+                response = self.response_queue.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError(f"[RemoteEmbedding] Camera {self.camera_id}: embedding server not responding")
+            if isinstance(response, BaseException):
+                raise RuntimeError(f"[RemoteEmbedding] Camera {self.camera_id}: embedding failed on the server") from response
+            features.append(self.slab.feats[:len(chunk)].copy())
+        if not features:
+            return np.empty((0, self.slab.feats.shape[1]), dtype=np.float32)
+        return np.concatenate(features, axis=0)
+
+
+def embedding_server(vec_config, num_cameras: int, max_crops: int, max_batch: int, max_wait: float,
+                     request_queue, response_queues, ready_queue):
+    """
+    Loads the ReID model once and embeds the crops of all cameras, batched across cameras.
+    Errors are sent back instead of the answer: to the runner through the ready queue while
+    loading, to the camera through its response queue while embedding.
+    """
+    from modules.embedding.build import build_embedding
+
+    try:
+        embed = build_embedding(vec_config)
+        crop_size = tuple(embed.cfg.INPUT.SIZE_TEST)
+        dim = embed.extract_feature([np.zeros((*crop_size, 3), dtype=np.uint8)]).shape[1]
+        slabs = [CameraSlab(max_crops, crop_size, dim) for _ in range(num_cameras)]
+        server_info = dict(crop_size=crop_size, dim=dim, max_crops=max_crops, interpolation=embed.interpolation,
+                           slab_names=[slab.names for slab in slabs])
+    except Exception as e:
+        ready_queue.put(e)
+        return
+    ready_queue.put(server_info)
+
+    # the service batches the requests of all cameras, each answered as soon as its batch is done
+    service = EmbeddingService(embed, max_batch, max_wait * 1000)
+
+    def respond(camera_id: int, n: int, future):
+        # raised in a done callback the error would only be logged, the camera waiting for nothing
+        try:
+            slabs[camera_id].feats[:n] = future.result()
+        except Exception as e:
+            response_queues[camera_id].put(e)
+            return
+        response_queues[camera_id].put(n)
+
+    while True:
+        request = request_queue.get()
+        if request is STOP:
+            break
+        camera_id, n = request
+        future = service.submit(list(slabs[camera_id].crops[:n]))
+        future.add_done_callback(functools.partial(respond, camera_id, n))
+
+    service.close()
+    service.report()
+    for slab in slabs:
+        slab.close()
+
+
+def camera_worker(camera_id: int, config: Dict, server_info: Dict, request_queue, response_queue):
+    """Decode, detect, track and gallery of one camera, embeddings come from the shared server."""
+    from main import SCRReid
+
+    embed = RemoteEmbedding(camera_id, server_info, request_queue, response_queue)
+    sct_reid = SCRReid(config, embed=embed)
+    sct_reid.run()
+    embed.slab.close()
+
+
+class MultiCameraRunner:
+    """One SCRReid worker process per camera and one embedding server process for all of them.
+
+    Every camera keeps its own tracker, TrackManager, Gallery and Matching; the OSNet model is
+    loaded once by the server, which batches the crops of all cameras.
+    """
+    def __init__(self, config: Dict):
+        self.config = config
+        multi_cfg = config["MULTI_CAMERA"]
+        self.cameras: List[Dict] = multi_cfg["cameras"]
+        self.max_batch = multi_cfg.get("max_batch", 64)
+        self.max_wait = multi_cfg.get("max_wait_ms", 5) / 1000.
+        self.max_crops = multi_cfg.get("max_crops_per_request", self.config["DETECTION"]["yolov11"]["max_det"])
+        # spawn: no fork of the parent's threads and torch state
+        self.ctx = mp.get_context("spawn")
+
+    def _camera_config(self, camera_cfg: Dict) -> Dict:
+        """The config of a camera: SOURCE overridden by its entry, no cv2 window in the workers."""
+        config = copy.deepcopy(self.config)
+        camera_cfg = dict(camera_cfg)
+        viz_cfg = config.setdefault("VIZ", {})
+        viz_cfg["display"] = False
+        if "out_video" in camera_cfg:
+            viz_cfg["out_video"] = camera_cfg.pop("out_video")
+        config.setdefault("SOURCE", {}).update(camera_cfg)
+        return config
+
+    def _wait_server(self, server, ready_queue, poll: float = 1.) -> Dict:
+        """The server info put on the ready queue, raises if the server failed or died while loading."""
+        while True:
+            try:
+                server_info = ready_queue.get(timeout=poll)
+                break
+            except queue.Empty:
+                if not server.is_alive():
+                    raise RuntimeError(f"[MultiCameraRunner] Embedding server exited with code {server.exitcode} before being ready")
+        if isinstance(server_info, BaseException):
+            server.join()
+            raise RuntimeError("[MultiCameraRunner] Embedding server failed to load") from server_info
+        return server_info
+
+    def run(self):
+        request_queue = self.ctx.Queue()
+        response_queues = [self.ctx.Queue() for _ in self.cameras]
+        ready_queue = self.ctx.Queue()
+        server = self.ctx.Process(
+            target=embedding_server,
+            args=(self.config["TRACK_MANAGER"]["VECTORIZATION"], len(self.cameras), self.max_crops,
+                  self.max_batch, self.max_wait, request_queue, response_queues, ready_queue),
+            daemon=True
+        )
+        server.start()
+        server_info = self._wait_server(server, ready_queue)
+        print(f"[MultiCameraRunner] Embedding server ready, starting {len(self.cameras)} cameras")
+
+        workers = [
+            self.ctx.Process(
+                target=camera_worker,
+                args=(camera_id, self._camera_config(camera_cfg), server_info, request_queue, response_queues[camera_id])
+            )
+            for camera_id, camera_cfg in enumerate(self.cameras)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        request_queue.put(STOP)
+        server.join()
@@ -0,0 +1,75 @@
+import queue
+import threading
+import time
+
+# put by a stage after its last item
+END_OF_STREAM = object()
+
+
+class StageQueue(queue.Queue):
+    """Bounded queue between two pipeline stages.
+
+    With drop_oldest the producer never waits: when the queue is full the oldest item is
+    dropped, which keeps live sources real-time when a later stage falls behind. on_drop is
+    called with every dropped item, e.g. to give its frame buffer back to the source.
+    """
+    def __init__(self, maxsize: int, drop_oldest: bool = False, on_drop=None):
+        super().__init__(maxsize)
+        self.drop_oldest = drop_oldest
+        self.on_drop = on_drop
+        self.num_dropped = 0
+
+    def put_item(self, item, stop_event: threading.Event) -> bool:
+        """Put item, returns False if the pipeline was stopped before it could be queued."""
+        while not stop_event.is_set():
+            if self.drop_oldest and item is not END_OF_STREAM:
+                try:
+                    self.put_nowait(item)
+                    return True
+                except queue.Full:
+                    try:
+                        dropped = self.get_nowait()
+                    except queue.Empty:
+                        continue
+                    self.num_dropped += 1
+                    if self.on_drop is not None and dropped is not END_OF_STREAM:
+                        self.on_drop(dropped)
+                continue
+            try:
+                self.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get_item(self, stop_event: threading.Event):
+        """Get the next item, END_OF_STREAM once the pipeline is stopped."""
+        while not stop_event.is_set():
+            try:
+                return self.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return END_OF_STREAM
+
+    def get_batch(self, max_items: int, timeout: float, stop_event: threading.Event):
+        """Get up to max_items, waiting at most timeout seconds after the first one.
+
+        Returns (items, ended), ended is True once END_OF_STREAM was read.
+        """
+        item = self.get_item(stop_event)
+        if item is END_OF_STREAM:
+            return [], True
+        items = [item]
+        deadline = time.monotonic() + timeout
+        while len(items) < max_items:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is END_OF_STREAM:
+                return items, True
+            items.append(item)
+        return items, False
@@ -0,0 +1,235 @@
+import collections
+import glob
+import json
+import subprocess
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+DEFAULT_FPS = 30
+
+
+class FrameRing:
+    """Preallocated pool of (h, w, 3) uint8 frame buffers, handed out by the source.
+
+    A buffer is only reused once the consumer gives it back with `release`, i.e. when no
+    pipeline stage holds the frame any more (consumed or dropped), `acquire` waits meanwhile.
+    """
+    def __init__(self, num_buffers: int, height: int, width: int):
+        self.buffers = np.empty((num_buffers, height, width, 3), dtype=np.uint8)
+        self.frames = list(self.buffers)
+        self.frame_ids = {id(frame): i for i, frame in enumerate(self.frames)}
+        self.free = collections.deque(range(num_buffers))
+        self.in_use = set()
+        self.cond = threading.Condition()
+        self.is_closed = False
+
+    def acquire(self) -> Optional[np.ndarray]:
+        """A free buffer, waits until one is released, None once the ring is closed."""
+        with self.cond:
+            while not self.free and not self.is_closed:
+                self.cond.wait()
+            if self.is_closed:
+                return None
+            i = self.free.popleft()
+            self.in_use.add(i)
+            return self.frames[i]
+
+    def release(self, frame: np.ndarray):
+        """Give a frame of the ring back, other arrays and already released frames are ignored."""
+        i = self.frame_ids.get(id(frame))
+        with self.cond:
+            if i not in self.in_use:
+                return
+            self.in_use.remove(i)
+            self.free.append(i)
+            self.cond.notify()
+
+    def close(self):
+        """Wake up the waiting `acquire`, which returns None."""
+        with self.cond:
+            self.is_closed = True
+            self.cond.notify_all()
+
+
+class FrameSource:
+    """Frame source with the cv2.VideoCapture read API, frames are read into a FrameRing.
+
+    Every frame read must be given back with `release_frame`, `read` waits for a free buffer.
+
+    Subclasses set width, height (after the scale filter) and fps, then call `_init_ring`.
+    """
+    def __init__(self, num_buffers: int, scale: Optional[List[int]] = None):
+        self.num_buffers = num_buffers
+        # [w, h] the frames are resized to, None for the native resolution
+        self.scale = tuple(scale) if scale else None
+        self.width = self.height = 0
+        self.fps = DEFAULT_FPS
+        self.ring: Optional[FrameRing] = None
+        self.is_opened = False
+
+    def _init_ring(self, width: int, height: int):
+        self.width, self.height = self.scale if self.scale else (width, height)
+        self.ring = FrameRing(self.num_buffers, self.height, self.width)
+        self.is_opened = True
+
+    def isOpened(self) -> bool:
+        return self.is_opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """The next frame, in a ring buffer to give back with `release_frame` once it is consumed."""
+        if not self.is_opened:
+            return False, None
+        frame = self.ring.acquire()
+        if frame is None:
+            return False, None
+        if not self._read_into(frame):
+            self.ring.release(frame)
+            self.release()
+            return False, None
+        return True, frame
+
+    def release_frame(self, frame: np.ndarray):
+        """The frame is no longer used by the pipeline, its buffer can be read into again."""
+        if self.ring is not None:
+            self.ring.release(frame)
+
+    def interrupt(self):
+        """Stop a read waiting for a free buffer, it returns False like at the end of the stream."""
+        if self.ring is not None:
+            self.ring.close()
+
+    def _read_into(self, frame: np.ndarray) -> bool:
+        raise NotImplementedError
+
+    def release(self):
+        self.is_opened = False
+
+
+class FileSource(FrameSource):
+    """Video file (or any cv2.VideoCapture url), decoded by OpenCV straight into the ring."""
+    def __init__(self, path: str, num_buffers: int, scale=None, fps=None):
+        super().__init__(num_buffers, scale)
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            print(f"[FileSource] Cannot open {path}")
+            return
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        width, height = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self._init_ring(width, height)
+        # decode buffer of the native resolution, resized into the ring
+        self.decoded = np.empty((height, width, 3), dtype=np.uint8) if self.scale else None
+
+    def _read_into(self, frame):
+        if self.decoded is None:
+            # VideoCapture writes into the given array when its shape and type match
+            ret, decoded = self.cap.read(frame)
+            if ret and decoded is not frame:
+                np.copyto(frame, decoded)
+            return ret
+        ret, decoded = self.cap.read(self.decoded)
+        if ret:
+            cv2.resize(decoded, (self.width, self.height), dst=frame, interpolation=cv2.INTER_AREA)
+        return ret
+
+    def release(self):
+        super().release()
+        self.cap.release()
+
+
+class FfmpegSource(FrameSource):
+    """ffmpeg subprocess (RTSP camera, file, ...) writing raw bgr24 frames to a pipe.
+
+    The resolution is probed with ffprobe and the optional scale is done by the ffmpeg scale
+    filter, frames are read from the pipe straight into the ring with readinto.
+    """
+    def __init__(self, url: str, num_buffers: int, scale=None, fps=None, ffmpeg_args: Optional[List[str]] = None,
+                 width=None, height=None):
+        super().__init__(num_buffers, scale)
+        probed_w, probed_h, probed_fps = probe_stream(url)
+        width, height = width or probed_w, height or probed_h
+        if not width or not height:
+            print(f"[FfmpegSource] Cannot probe the resolution of {url}, set width and height in SOURCE")
+            return
+        self.fps = fps or probed_fps or DEFAULT_FPS
+
+        cmd = ["ffmpeg", "-loglevel", "error", *(ffmpeg_args or []), "-i", url, "-an"]
+        if self.scale:
+            cmd += ["-vf", f"scale={self.scale[0]}:{self.scale[1]}"]
+        cmd += ["-c:v", "rawvideo", "-pix_fmt", "bgr24", "-f", "rawvideo", "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        self._init_ring(width, height)
+
+    def _read_into(self, frame):
+        view = memoryview(frame).cast('B')
+        num_read = 0
+        while num_read < len(view):
+            n = self.proc.stdout.readinto(view[num_read:])
+            if not n:
+                return False
+            num_read += n
+        return True
+
+    def release(self):
+        if self.is_opened:
+            self.proc.terminate()
+            self.proc.wait()
+        super().release()
+
+
+class ImageSequenceSource(FrameSource):
+    """Images matching a glob pattern, read in sorted order, resolution of the first image."""
+    def __init__(self, pattern: str, num_buffers: int, scale=None, fps=None):
+        super().__init__(num_buffers, scale)
+        self.paths = sorted(glob.glob(pattern))
+        self.next_path = 0
+        self.fps = fps or DEFAULT_FPS
+        if not self.paths:
+            print(f"[ImageSequenceSource] No image matches {pattern}")
+            return
+        height, width = cv2.imread(self.paths[0]).shape[:2]
+        self._init_ring(width, height)
+
+    def _read_into(self, frame):
+        while self.next_path < len(self.paths):
+            img = cv2.imread(self.paths[self.next_path])
+            self.next_path += 1
+            if img is None:
+                continue
+            if img.shape[:2] == (self.height, self.width):
+                np.copyto(frame, img)
+            else:
+                cv2.resize(img, (self.width, self.height), dst=frame, interpolation=cv2.INTER_AREA)
+            return True
+        return False
+
+
+def probe_stream(url: str) -> Tuple[int, int, float]:
+    """Returns (width, height, fps) of the first video stream with ffprobe, zeros when unknown."""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=width,height,avg_frame_rate", "-of", "json", url]
+    try:
+        streams = json.loads(subprocess.run(cmd, capture_output=True, timeout=30).stdout or b'{}').get("streams", [])
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        streams = []
+    if not streams:
+        return 0, 0, 0.
+    stream = streams[0]
+    num, _, den = stream.get("avg_frame_rate", "0/1").partition('/')
+    fps = float(num) / float(den) if den and float(den) else 0.
+    return int(stream.get("width", 0)), int(stream.get("height", 0)), fps
+
+
+def build_source(source_cfg: Dict, num_buffers: int) -> FrameSource:
+    source_type = source_cfg.get("type", "file")
+    path = source_cfg.get("path", "../assets/video_2min.mp4")
+    scale = source_cfg.get("scale")
+    fps = source_cfg.get("fps")
+    if source_type == "ffmpeg":
+        return FfmpegSource(path, num_buffers, scale, fps, source_cfg.get("ffmpeg_args"),
+                            source_cfg.get("width"), source_cfg.get("height"))
+    if source_type == "images":
+        return ImageSequenceSource(path, num_buffers, scale, fps)
+    return FileSource(path, num_buffers, scale, fps)
@@ -0,0 +1,49 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from modules.pipeline.queues import StageQueue, END_OF_STREAM
+
+
+class AsyncVideoWriter:
+    """cv2.VideoWriter in a background thread fed by a bounded queue.
+
+    `write` only queues the frame, so encoding overlaps with the pipeline; it blocks when the
+    queue is full. Queued frames are not copied: `on_written(frame)` is called once the frame
+    is encoded, after which the caller may reuse its buffer.
+    """
+    def __init__(self, out_path: str, fps: float, frame_size, queue_size: int = 32, fourcc: str = 'mp4v'):
+        out_dir = os.path.dirname(out_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        # frame_size is (w, h), frames of another size are resized before encoding
+        self.frame_size = tuple(frame_size)
+        self.writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*fourcc), fps, self.frame_size)
+        self.queue = StageQueue(queue_size)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._write_stage, daemon=True)
+        self.thread.start()
+
+    def write(self, frame: np.ndarray, on_written=None):
+        self.queue.put_item((frame, on_written), self.stop_event)
+
+    def _write_stage(self):
+        while True:
+            item = self.queue.get_item(self.stop_event)
+            if item is END_OF_STREAM:
+                break
+            frame, on_written = item
+            if (frame.shape[1], frame.shape[0]) != self.frame_size:
+                self.writer.write(cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA))
+            else:
+                self.writer.write(frame)
+            if on_written is not None:
+                on_written(frame)
+
+    def release(self):
+        """Write the queued frames and close the file."""
+        self.queue.put_item(END_OF_STREAM, self.stop_event)
+        self.thread.join()
+        self.writer.release()
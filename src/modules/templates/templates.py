@@ -1,7 +1,10 @@
-from typing import Dict, List
+from typing import Deque, Dict, List, Tuple
+from collections import deque
 from dataclasses import dataclass, field
 import datetime
 
+import numpy as np
+
 class DetectionBox:
     def __init__(self, bbox: List[float], box_id: int, iou: float):
         self.bbox = bbox
@@ -15,12 +18,69 @@ class DetectionBox:
             'iou': self.iou
         }
 
+class CropBuffer:
+    """Fixed-capacity ring buffer of owned, equally sized uint8 person crops.
+    
+    Crops are addressed by a running crop id, only the latest `capacity` crops are kept.
+    """
+    def __init__(self, capacity: int, crop_size: Tuple[int, int]):
+        self.capacity = capacity
+        self.crop_size = tuple(crop_size)  # (h, w)
+        self.crops = np.empty((capacity, *self.crop_size, 3), dtype=np.uint8)
+        self.is_embedded = np.zeros(capacity, dtype=bool)
+        self.num_crops = 0
+    
+    def __len__(self):
+        return self.num_crops - self.first_id
+    
+    def __iter__(self):
+        for crop_id in self.crop_ids():
+            yield self[crop_id]
+    
+    def __getitem__(self, crop_id: int) -> np.ndarray:
+        if not self.first_id <= crop_id < self.num_crops:
+            raise IndexError(f"Crop {crop_id} is not in buffer [{self.first_id}, {self.num_crops})")
+        return self.crops[crop_id % self.capacity]
+    
+    @property
+    def first_id(self) -> int:
+        return max(0, self.num_crops - self.capacity)
+    
+    def crop_ids(self) -> range:
+        return range(self.first_id, self.num_crops)
+    
+    def append(self, crop: np.ndarray, is_embedded: bool = False) -> int:
+        slot = self.num_crops % self.capacity
+        self.crops[slot] = crop
+        self.is_embedded[slot] = is_embedded
+        self.num_crops += 1
+        return self.num_crops - 1
+    
+    def extend(self, other: 'CropBuffer'):
+        for crop_id in other.crop_ids():
+            self.append(other[crop_id], other.is_embedded[crop_id % other.capacity])
+    
+    def mark_embedded(self, crop_id: int):
+        if self.first_id <= crop_id < self.num_crops:
+            self.is_embedded[crop_id % self.capacity] = True
+    
+    def get_missing_ids(self, num_last: int) -> List[int]:
+        """Ids of the last `num_last` kept crops that have no embedding yet."""
+        start = max(self.first_id, self.num_crops - num_last)
+        return [i for i in range(start, self.num_crops) if not self.is_embedded[i % self.capacity]]
+    
+    def to_list(self) -> List[np.ndarray]:
+        return [crop.copy() for crop in self]
+
+
 class TrackInfo:
-    def __init__(self, track_id: int, frame_id: int, timestamp: datetime.datetime):
+    def __init__(self, track_id: int, frame_id: int, timestamp: datetime.datetime,
+                 max_num_crops: int = 32, crop_size: Tuple[int, int] = (256, 128), max_num_embeds: int = 32):
         self.track_id = track_id
-        self.cropped_person: List[List[float]] = []
-        self.embeddings: List[List[float]] = []
-        self.bboxes: List[List[float]] = []
+        self.cropped_person = CropBuffer(max_num_crops, crop_size)
+        # only the latest max_num_embeds are kept, a long track does not grow without bound
+        self.embeddings: Deque[List[float]] = deque(maxlen=max_num_embeds)
+        self.bboxes: Deque[List[float]] = deque(maxlen=max_num_embeds)
         
         self.start_frame = frame_id
         self.end_frame = frame_id
@@ -34,6 +94,13 @@ class TrackInfo:
     def get_len_embeddings(self):
         return len(self.embeddings)
     
+    def add_embedding(self, crop_id: int, embedding):
+        self.embeddings.append(embedding)
+        self.cropped_person.mark_embedded(crop_id)
+    
+    def get_missing_crop_ids(self, num_last: int) -> List[int]:
+        return self.cropped_person.get_missing_ids(num_last)
+    
     @property
     def get_len_bboxes(self):
         return len(self.bboxes)
@@ -41,9 +108,9 @@ class TrackInfo:
     def to_dict(self) -> Dict:
         return {
             'track_id': self.track_id,
-            'cropped_person': self.cropped_person,
-            'embeddings': self.embeddings,
-            'bboxes': self.bboxes,
+            'cropped_person': self.cropped_person.to_list(),
+            'embeddings': list(self.embeddings),
+            'bboxes': list(self.bboxes),
             'start_frame': self.start_frame,
             'end_frame': self.end_frame,
             'start_time': self.start_time.isoformat() if self.start_time else None,
@@ -1,50 +1,85 @@
 from typing import Dict, List
 
-from modules.templates.templates import TrackInfo, TimeSession, sTrackInfo
+import cv2
+
+from modules.templates.templates import TrackInfo
 from modules.matching.matching import Matching
-from modules.gallery.gallery import Gallery
-from modules.embedding.fastreid.embed import Embedding
+from modules.gallery.storage import EmbeddingStorage
+from modules.embedding.base import IEmbedding
+from modules.embedding.build import build_embedding
+from modules.embedding.service import EmbeddingService
 
 class TrackManager:
-    def __init__(self, track_manager_config: Dict):
+    def __init__(self, track_manager_config: Dict, embed: IEmbedding = None):
         self.dict_tracks: Dict[int, TrackInfo] = {}
         self.config = track_manager_config
         self.select_cfg = track_manager_config["VECTORIZATION"]["selection"]
         self.num_init = track_manager_config["min_hits"]
         self.is_join_track = track_manager_config["join_track"]["enable"]
         
-        vec_config = track_manager_config["VECTORIZATION"]["fast_reid"]
-        self.embed = Embedding(vec_config)
+        # embed is given when the model is shared, e.g. the embedding server of the multi-camera runner
+        if embed is None:
+            embed = build_embedding(track_manager_config["VECTORIZATION"])
+            # micro-batching service: the crops of a frame are embedded while tracking goes on
+            service_cfg = track_manager_config["VECTORIZATION"].get("service", {})
+            if service_cfg.get("enable", False):
+                embed = EmbeddingService(embed, service_cfg.get("max_batch", 64), service_cfg.get("max_wait_ms", 2))
+        self.embed = embed
+        # (future, [(track_id, crop_id), ...]) of the crops submitted to the service, not yet added to the tracks
+        self._pending_embeddings: List = []
         
         if self.is_join_track:
             self.max_dist_join = track_manager_config["join_track"]["max_dist"]
             self.matching = Matching(track_manager_config["join_track"])
             self._joined_tracks: Dict[int, TrackInfo] = {}
-            self.gallery = Gallery(track_manager_config["GALLERY"])
+            # latest embeddings of the dead tracks, keyed by track id, queried by join_tracks
+            max_no_embds = track_manager_config.get("GALLERY", {}).get("max_num_vec", 20)
+            self.dead_track_pool = EmbeddingStorage(max_no_embds)
             
         
         self.num_init = track_manager_config["min_hits"] 
         self.min_num_embeds = track_manager_config["min_num_embeds"]
         self.max_num_embeds = track_manager_config["max_num_embeds"]
+        # a track keeps its latest max_num_embeds bboxes, enough to count min_hits
+        assert self.max_num_embeds >= self.num_init, "max_num_embeds must be at least min_hits"
         self.max_fragment_frame = track_manager_config["max_fragment_frame"]
+        self.max_num_crops = track_manager_config.get("max_num_crops", self.max_num_embeds)
+        self.crop_size = tuple(self.embed.cfg.INPUT.SIZE_TEST)
+        # crops are resized once here, the way the embedder would resize them
+        self.interpolation = self.embed.interpolation
         
     def add_new_track_to_dict(self, track_id, new_track: TrackInfo):
         self.dict_tracks[track_id] = new_track
     
     def update_session_tracks(self, alive_tracks: List, dead_tracks: List[int], frame, frame_id, timestamp):
+        self.collect_embeddings()
+        # gather every crop of the frame so the embedder runs a single batch per frame
+        frame_tracks = []
+        cropped_persons = []
         for alive_track in alive_tracks:
             track_id = int(alive_track[-1])
             bbox = list(map(int, alive_track[:4]))
             # track not in inited tracks
             if track_id not in self.dict_tracks.keys():
-                new_track = TrackInfo(track_id, frame_id, timestamp)
+                new_track = TrackInfo(track_id, frame_id, timestamp, self.max_num_crops, self.crop_size, self.max_num_embeds)
                 self.add_new_track_to_dict(track_id, new_track)
-            
+            frame_tracks.append((track_id, bbox))
+            cropped_persons.append(resize_crop(crop_box(frame, bbox), self.crop_size, self.interpolation))
+        
+        track_crop_ids = []
+        for (track_id, bbox), cropped_person in zip(frame_tracks, cropped_persons):
             # update values
-            cropped_person = crop_box(frame, bbox)
-            self.dict_tracks[track_id].cropped_person.append(cropped_person)
+            crop_id = self.dict_tracks[track_id].cropped_person.append(cropped_person)
             self.dict_tracks[track_id].bboxes.append(bbox)
-            self.dict_tracks[track_id].embeddings.append(self.embed.extract_feature(cropped_person))
+            track_crop_ids.append((track_id, crop_id))
+        if track_crop_ids:
+            if isinstance(self.embed, EmbeddingService):
+                # added to the tracks when first needed, at the latest on the next frame
+                self._pending_embeddings.append((self.embed.submit(cropped_persons), track_crop_ids))
+            else:
+                self._add_embeddings(track_crop_ids, self.embed.extract_feature(cropped_persons))
+        
+        for track_id, bbox in frame_tracks:
             self.dict_tracks[track_id].end_frame = frame_id
             self.dict_tracks[track_id].end_time = timestamp
             
@@ -52,6 +87,7 @@ class TrackManager:
             if not self.dict_tracks[track_id].is_inited and len(self.dict_tracks[track_id].bboxes) >= self.num_init:
                 match_track_id = -1
                 if self.is_join_track:
+                    self.collect_embeddings()
                     self.update_embedding_of_track(track_id)
                     match_track_id = self.join_tracks(self.dict_tracks[track_id])
 
@@ -66,8 +102,11 @@ class TrackManager:
             if dead_track_id < 0: 
                 continue
             if dead_track_id in self.dict_tracks.keys():
+                self.collect_embeddings()
                 self.update_embedding_of_track(dead_track_id)
                 self.dict_tracks[dead_track_id].is_dead = True
+                if self.is_join_track:
+                    self.add_to_dead_track_pool(self.dict_tracks[dead_track_id])
         
         # remove tracks with max fragment frame
         remove_tracks = []
@@ -77,40 +116,58 @@ class TrackManager:
         
         for track_id in remove_tracks:
             self.dict_tracks.pop(track_id)
+            if self.is_join_track:
+                self.remove_from_dead_track_pool(track_id)
             if self.is_join_track and track_id in self._joined_tracks:
                 self._joined_tracks.pop(track_id)
         
         return self.dict_tracks
 
+    def collect_embeddings(self):
+        """Wait for the embeddings submitted to the service and add them to their tracks."""
+        for future, track_crop_ids in self._pending_embeddings:
+            self._add_embeddings(track_crop_ids, future.result())
+        self._pending_embeddings = []
+    
+    def _add_embeddings(self, track_crop_ids: List, embeddings):
+        for (track_id, crop_id), embedding in zip(track_crop_ids, embeddings):
+            # the track may have been removed or its crop evicted meanwhile
+            if track_id in self.dict_tracks and crop_id >= self.dict_tracks[track_id].cropped_person.first_id:
+                self.dict_tracks[track_id].add_embedding(crop_id, embedding)
+    
+    def close(self):
+        self.collect_embeddings()
+        if isinstance(self.embed, EmbeddingService):
+            self.embed.close()
+            self.embed.report()
+    
     def update_embedding_of_track(self, track_id: int):
-        selected_crop_persons = []
-        if len(self.dict_tracks[track_id].embeddings) >= self.max_num_embeds:
-            selected_crop_persons = self.dict_tracks[track_id].cropped_person[-self.max_num_embeds:]
-        if not selected_crop_persons:
+        # only embed the latest crops that were not embedded frame-by-frame
+        missing_crop_ids = self.dict_tracks[track_id].get_missing_crop_ids(self.max_num_embeds)
+        if not missing_crop_ids:
             return
         
+        selected_crop_persons = [self.dict_tracks[track_id].cropped_person[i] for i in missing_crop_ids]
         embeddings = self.embed.extract_feature(selected_crop_persons)
-        for embedding in embeddings:
-            self.dict_tracks[track_id].embeddings.append(embedding)
+        for crop_id, embedding in zip(missing_crop_ids, embeddings):
+            self.dict_tracks[track_id].add_embedding(crop_id, embedding)
 
         print("Check len embed:", self.dict_tracks[track_id].get_len_embeddings())
     
+    def add_to_dead_track_pool(self, track_info: TrackInfo):
+        self.remove_from_dead_track_pool(track_info.track_id)
+        # the pool keeps the latest max_no_embds of them
+        self.dead_track_pool.append(track_info.track_id, track_info.embeddings)
+    
+    def remove_from_dead_track_pool(self, track_id: int):
+        if track_id not in self.dead_track_pool:
+            return
+        self.dead_track_pool.evict(track_id)
+        self.dead_track_pool.maybe_compact()
+    
     def join_tracks(self, new_track: TrackInfo):
-        candidate_tracks = []
-        for track_info in self.dict_tracks.values():
-            self.gallery.customer_gallery.clear()
-            if not track_info.is_dead:
-                continue
-            start_time = track_info.start_time
-            end_time = track_info.end_time
-            time_session = TimeSession(start_time, end_time)
-            embeddings = track_info.embeddings
-            s_track_info = sTrackInfo(track_id=track_info.track_id, time_session=time_session, embeddings=embeddings)
-            customer_id = self.gallery.create_new(s_track_info)
-            self.gallery.update_one(customer_id, s_track_info)
-            candidate_tracks.append(self.gallery.customer_gallery[customer_id])
-        
-        match_results = self.matching.match_with_all_ids(new_track, candidate_tracks)
+        dead_track_ids = list(self.dead_track_pool.customer_blocks.keys())
+        match_results = self.matching.match_with_storage(new_track, self.dead_track_pool, dead_track_ids)
         
         for match_result in match_results:
             if match_result.match_frequency >= 5:
@@ -125,8 +182,11 @@ class TrackManager:
         
         # recover track
         self.dict_tracks[match_track_id].is_dead = False
+        self.remove_from_dead_track_pool(match_track_id)
         self.dict_tracks[match_track_id].bboxes.extend(self.dict_tracks[new_track.track_id].bboxes)
+        # carry over the embeddings already computed for the new track's crops
         self.dict_tracks[match_track_id].cropped_person.extend(self.dict_tracks[new_track.track_id].cropped_person)
+        self.dict_tracks[match_track_id].embeddings.extend(self.dict_tracks[new_track.track_id].embeddings)
         # remove track
         self.dict_tracks.pop(new_track.track_id)
     
@@ -135,6 +195,11 @@ def crop_box(frame, bbox):
     cropped_frame = frame[y1:y2, x1:x2]
     return cropped_frame
 
+def resize_crop(cropped_frame, crop_size, interpolation=cv2.INTER_CUBIC):
+    # copy the crop out of the frame at the embedder input size (h, w)
+    h, w = crop_size
+    return cv2.resize(cropped_frame, (w, h), interpolation=interpolation)
+
 def check_condition(box, box_iou, select_cfg):        
     x1, y1, x2, y2 = box 
     w = x2 - x1
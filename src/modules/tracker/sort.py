@@ -20,7 +20,6 @@ from __future__ import print_function
 import numpy as np
 from typing import Dict
 import argparse
-from filterpy.kalman import KalmanFilter
 
 np.random.seed(0)
 
@@ -29,7 +28,8 @@ def linear_assignment(cost_matrix):
     try:
         import lap
         _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
-        return np.array([[y[i], i] for i in x if i >= 0])
+        rows = np.where(x >= 0)[0]
+        return np.stack([rows, x[rows]], axis=1)
     except ImportError:
         from scipy.optimize import linear_sum_assignment
         x, y = linear_sum_assignment(cost_matrix)
@@ -85,41 +85,124 @@ def convert_x_to_bbox(x, score=None):
         return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2., score]).reshape((1, 5))
 
 
+def convert_bboxes_to_z(bboxes):
+    """
+    Vectorized convert_bbox_to_z: takes boxes of shape (N, >=4) in the form [x1,y1,x2,y2]
+    and returns z of shape (N, 4) in the form [x,y,s,r]
+    """
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    x = bboxes[:, 0] + w / 2.
+    y = bboxes[:, 1] + h / 2.
+    return np.stack([x, y, w * h, w / h.astype(float)], axis=1)
+
+
+def convert_xs_to_bboxes(xs):
+    """
+    Vectorized convert_x_to_bbox: takes states of shape (N, >=4) in the centre form [x,y,s,r]
+    and returns boxes of shape (N, 4) in the form [x1,y1,x2,y2]
+    """
+    w = np.sqrt(xs[:, 2] * xs[:, 3])
+    h = xs[:, 2] / w
+    return np.stack([xs[:, 0] - w / 2., xs[:, 1] - h / 2., xs[:, 0] + w / 2., xs[:, 1] + h / 2.], axis=1)
+
+
+class KalmanBoxFilters(object):
+    """
+    Constant velocity Kalman filters of all tracked bboxes, stacked into one (N, 7) state
+    array and one (N, 7, 7) covariance array so predict/update run once per frame.
+    Row i belongs to the i-th tracker of the owning Sort instance.
+    """
+    # define constant velocity model
+    F = np.array([
+        [1, 0, 0, 0, 1, 0, 0],
+        [0, 1, 0, 0, 0, 1, 0],
+        [0, 0, 1, 0, 0, 0, 1],
+        [0, 0, 0, 1, 0, 0, 0],
+        [0, 0, 0, 0, 1, 0, 0],
+        [0, 0, 0, 0, 0, 1, 0],
+        [0, 0, 0, 0, 0, 0, 1]
+    ], dtype=float)
+    H = np.array([
+        [1, 0, 0, 0, 0, 0, 0],
+        [0, 1, 0, 0, 0, 0, 0],
+        [0, 0, 1, 0, 0, 0, 0],
+        [0, 0, 0, 1, 0, 0, 0]
+    ], dtype=float)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    # give high uncertainty to the unobservable initial velocities
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    def __init__(self):
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, bboxes):
+        """
+        Initialises one filter per bbox in bboxes, appended after the existing rows.
+        """
+        x = np.zeros((len(bboxes), 7))
+        x[:, :4] = convert_bboxes_to_z(np.asarray(bboxes, dtype=float))
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, np.broadcast_to(self.P0, (len(bboxes), 7, 7))])
+
+    def remove(self, indices):
+        self.x = np.delete(self.x, indices, axis=0)
+        self.P = np.delete(self.P, indices, axis=0)
+
+    def predict(self):
+        """
+        Advances all state vectors and returns the predicted bounding boxes, shape (N, 4).
+        """
+        self.x[self.x[:, 6] + self.x[:, 2] <= 0, 6] = 0.
+        self.x = self.x @ self.F.T
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return convert_xs_to_bboxes(self.x)
+
+    def position_std(self):
+        """
+        Returns the standard deviation of the predicted box centres, shape (N,), in pixels.
+        """
+        return np.sqrt(self.P[:, 0, 0] + self.P[:, 1, 1])
+
+    def update(self, indices, bboxes):
+        """
+        Updates the state vectors of rows indices with the observed bboxes.
+        """
+        if len(indices) == 0:
+            return
+        z = convert_bboxes_to_z(np.asarray(bboxes, dtype=float))
+        x = self.x[indices]
+        P = self.P[indices]
+
+        y = z - x @ self.H.T
+        PHT = P @ self.H.T
+        S = self.H @ PHT + self.R
+        K = PHT @ np.linalg.inv(S)
+        x = x + (K @ y[..., None])[..., 0]
+        # Joseph form, as filterpy does
+        I_KH = np.eye(7) - K @ self.H
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+
+        self.x[indices] = x
+        self.P[indices] = P
+
+
 class KalmanBoxTracker(object):
     """
     This class represents the internal state of individual tracked objects observed as bbox.
+    The Kalman state itself lives in the matching row of KalmanBoxFilters.
     """
     count = 0
 
-    def __init__(self, bbox):
+    def __init__(self):
         """
-        Initialises a tracker using initial bounding box.
+        Initialises the bookkeeping of a new track.
         """
-        # define constant velocity model
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array([
-            [1, 0, 0, 0, 1, 0, 0],
-            [0, 1, 0, 0, 0, 1, 0],
-            [0, 0, 1, 0, 0, 0, 1],
-            [0, 0, 0, 1, 0, 0, 0],
-            [0, 0, 0, 0, 1, 0, 0],
-            [0, 0, 0, 0, 0, 1, 0],
-            [0, 0, 0, 0, 0, 0, 1]
-        ])
-        self.kf.H = np.array([
-            [1, 0, 0, 0, 0, 0, 0],
-            [0, 1, 0, 0, 0, 0, 0],
-            [0, 0, 1, 0, 0, 0, 0],
-            [0, 0, 0, 1, 0, 0, 0]
-        ])
-
-        self.kf.R[2:, 2:] *= 10.
-        self.kf.P[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
-        self.kf.P *= 10.
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[4:, 4:] *= 0.01
-
-        self.kf.x[:4] = convert_bbox_to_z(bbox)
         self.time_since_update = 0
         self.id = KalmanBoxTracker.count
         KalmanBoxTracker.count += 1
@@ -127,37 +210,28 @@ class KalmanBoxTracker(object):
         self.hits = 0
         self.hit_streak = 0
         self.age = 0
+        self.score = 0.
 
-    def update(self, bbox):
+    def update(self):
         """
-        Updates the state vector with observed bbox.
+        Records that the track was matched with a detection.
         """
         self.time_since_update = 0
         self.history = []
         self.hits += 1
         self.hit_streak += 1
-        self.kf.update(convert_bbox_to_z(bbox))
 
-    def predict(self):
+    def predict(self, bbox):
         """
-        Advances the state vector and returns the predicted bounding box estimate.
+        Records the predicted bounding box estimate and returns it.
         """
-        if (self.kf.x[6] + self.kf.x[2]) <= 0:
-            self.kf.x[6] *= 0.0
-        self.kf.predict()
         self.age += 1
         if self.time_since_update > 0:
             self.hit_streak = 0
         self.time_since_update += 1
-        self.history.append(convert_x_to_bbox(self.kf.x))
+        self.history.append(bbox.reshape((1, 4)))
         return self.history[-1]
 
-    def get_state(self):
-        """
-        Returns the current bounding box estimate.
-        """
-        return convert_x_to_bbox(self.kf.x)
-
 
 def associate_detections_to_trackers(detections, trackers, det_size=5, iou_threshold=0.3):
     """
@@ -177,31 +251,22 @@ def associate_detections_to_trackers(detections, trackers, det_size=5, iou_thres
         else:
             matched_indices = linear_assignment(-iou_matrix)
     else:
-        matched_indices = np.empty(shape=(0, 2))
-
-    unmatched_detections = []
-    for d, _ in enumerate(detections):
-        if d not in matched_indices[:, 0]:
-            unmatched_detections.append(d)
-    unmatched_trackers = []
-    for t, _ in enumerate(trackers):
-        if t not in matched_indices[:, 1]:
-            unmatched_trackers.append(t)
-
-    # filter out matched with low IOU
-    matches = []
-    for m in matched_indices:
-        if iou_matrix[m[0], m[1]] < iou_threshold:
-            unmatched_detections.append(m[0])
-            unmatched_trackers.append(m[1])
-        else:
-            matches.append(m.reshape(1, 2))
-    if len(matches) == 0:
-        matches = np.empty((0, 2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
+        matched_indices = np.empty(shape=(0, 2), dtype=int)
+    matched_indices = matched_indices.astype(int).reshape(-1, 2)
 
-    return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+    # filter out matched with low IOU (NaN IoUs pass, as in the reference SORT)
+    low_iou = iou_matrix[matched_indices[:, 0], matched_indices[:, 1]] < iou_threshold
+    matches = matched_indices[~low_iou]
+
+    # unassigned first, then the ones rejected by the IoU gate
+    det_assigned = np.zeros(len(detections), dtype=bool)
+    det_assigned[matched_indices[:, 0]] = True
+    trk_assigned = np.zeros(len(trackers), dtype=bool)
+    trk_assigned[matched_indices[:, 1]] = True
+    unmatched_detections = np.concatenate([np.where(~det_assigned)[0], matched_indices[low_iou, 0]])
+    unmatched_trackers = np.concatenate([np.where(~trk_assigned)[0], matched_indices[low_iou, 1]])
+
+    return matches, unmatched_detections, unmatched_trackers
 
 
 class Sort(object):
@@ -214,6 +279,7 @@ class Sort(object):
         self.iou_threshold = sort_config["iou_threshold"]
         self.det_size = sort_config.get(sort_config["det_size"], 5)
         self.trackers = []
+        self.filters = KalmanBoxFilters()
         self.frame_count = 0
 
     def update(self, dets=np.empty((0, 5))):
@@ -226,44 +292,119 @@ class Sort(object):
         NOTE: The number of objects returned may differ from the number of detections provided.
         """
         self.frame_count += 1
+        if len(dets) == 0:
+            dets = np.empty((0, 5))
         # get predicted locations from existing trackers.
         trks = np.zeros((len(self.trackers), self.det_size))
-        to_del = []
         ret = []
-        for t, trk in enumerate(trks):
-            pos = self.trackers[t].predict()[0]
-            trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
-            if np.any(np.isnan(pos)):
-                to_del.append(t)
+        pred_boxes = self.filters.predict()
+        for t, trk in enumerate(self.trackers):
+            trk.predict(pred_boxes[t])
+        trks[:, :4] = pred_boxes
+        to_del = np.where(np.any(np.isnan(pred_boxes), axis=1))[0]
         trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
         for t in reversed(to_del):
             self.trackers.pop(t)
+        self.filters.remove(to_del)
         matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, det_size=self.det_size, iou_threshold=self.iou_threshold)
 
         # update matched trackers with assigned detections
+        self.filters.update(matched[:, 1], dets[matched[:, 0], :4])
         alive_tracks = []
         alive_indices = dict()
         for m in matched:
-            self.trackers[m[1]].update(dets[m[0], :])
+            self.trackers[m[1]].update()
             x1, y1, x2, y2, score = dets[m[0]]
+            self.trackers[m[1]].score = score
             alive_tracks.append([x1, y1, x2, y2, score, self.trackers[m[1]].id])
             alive_indices[m[0]] = self.trackers[m[1]].id
 
         # create and initialise new trackers for unmatched detections
+        self.filters.add(dets[unmatched_dets.astype(int), :4])
         for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :])
+            trk = KalmanBoxTracker()
             self.trackers.append(trk)
             x1, y1, x2, y2, score = dets[i]
+            trk.score = score
             alive_tracks.append([x1, y1, x2, y2, score, trk.id])
             alive_indices[i] = trk.id
 
         i = len(self.trackers)
         dead_tracks = []
+        dead_indices = []
         for trk in reversed(self.trackers):
             i -= 1
             # remove dead tracklet
             if trk.time_since_update > self.max_age:
                 dead_tracks.append(trk.id)
+                dead_indices.append(i)
                 self.trackers.pop(i)
+        self.filters.remove(dead_indices)
 
         return alive_tracks, alive_indices, dead_tracks
+
+    def predict(self):
+        """
+        Advances all trackers by one frame without detections, for frames where detection is skipped.
+        Trackers are not counted as missed.
+        Returns the predicted boxes of the trackers matched at the last detection, in the format of
+        the alive tracks of update: [[x1,y1,x2,y2,score,id],...].
+        """
+        self.frame_count += 1
+        pred_boxes = self.filters.predict()
+        to_del = np.where(np.any(np.isnan(pred_boxes), axis=1))[0]
+        alive_tracks = []
+        for t, trk in enumerate(self.trackers):
+            trk.history.append(pred_boxes[t].reshape((1, 4)))
+            if trk.time_since_update == 0 and t not in to_del:
+                x1, y1, x2, y2 = pred_boxes[t]
+                alive_tracks.append([x1, y1, x2, y2, trk.score, trk.id])
+        for t in reversed(to_del):
+            self.trackers.pop(t)
+        self.filters.remove(to_del)
+
+        return alive_tracks
+
+
+if __name__ == '__main__':
+    # @ ./src$ python -m modules.tracker.sort --num-dets 200
+    # micro-benchmark of associate_detections_to_trackers against the previous python-loop version
+    import time
+
+    def associate_detections_to_trackers_loop(detections, trackers, det_size=5, iou_threshold=0.3):
+        iou_matrix = iou_batch(detections, trackers)
+        a = (iou_matrix > iou_threshold).astype(np.int32)
+        if a.sum(1).max() == 1 and a.sum(0).max() == 1:
+            matched_indices = np.stack(np.where(a), axis=1)
+        else:
+            matched_indices = linear_assignment(-iou_matrix)
+        unmatched_detections = [d for d, _ in enumerate(detections) if d not in matched_indices[:, 0]]
+        unmatched_trackers = [t for t, _ in enumerate(trackers) if t not in matched_indices[:, 1]]
+        matches = []
+        for m in matched_indices:
+            if iou_matrix[m[0], m[1]] < iou_threshold:
+                unmatched_detections.append(m[0])
+                unmatched_trackers.append(m[1])
+            else:
+                matches.append(m.reshape(1, 2))
+        matches = np.concatenate(matches, axis=0) if matches else np.empty((0, 2), dtype=int)
+        return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+
+    parser = argparse.ArgumentParser(description='associate_detections_to_trackers micro-benchmark')
+    parser.add_argument('--num-dets', type=int, default=200)
+    parser.add_argument('--num-iters', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 1920, (args.num_dets, 2))
+    trackers = np.c_[xy, xy + rng.uniform(40, 120, (args.num_dets, 2)), np.zeros(args.num_dets)]
+    detections = trackers + np.c_[rng.normal(0, 15, (args.num_dets, 4)), rng.uniform(0.3, 1, args.num_dets)]
+    detections = detections[rng.permutation(args.num_dets)[:int(args.num_dets * 0.9)]]
+
+    for name, fn in [('loop', associate_detections_to_trackers_loop), ('vectorized', associate_detections_to_trackers)]:
+        st_time = time.time()
+        for _ in range(args.num_iters):
+            results = fn(detections, trackers)
+        print('{}: {:.3f} ms/call'.format(name, (time.time() - st_time) * 1000 / args.num_iters))
+    for r_loop, r_vec in zip(associate_detections_to_trackers_loop(detections, trackers), results):
+        assert np.array_equal(r_loop, r_vec), 'Vectorized association must match the loop version'
@@ -0,0 +1,20 @@
+import argparse
+
+from modules.config_loader.yaml_loader import load_config
+from modules.pipeline.multi_camera import MultiCameraRunner
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Multi-camera SCT ReID, one process per camera and a shared embedding server')
+    parser.add_argument('--config', default='../cfg/cfg.yaml')
+    parser.add_argument('--sources', nargs='+', help='video files or urls, one camera each, overrides MULTI_CAMERA.cameras')
+    parser.add_argument('--source-type', choices=['file', 'ffmpeg', 'images'], default='file')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    config = load_config(args.config)
+    if args.sources:
+        config.setdefault("MULTI_CAMERA", {})["cameras"] = [dict(type=args.source_type, path=path) for path in args.sources]
+    runner = MultiCameraRunner(config)
+    runner.run()